@@ -0,0 +1,161 @@
+import argparse
+import glob
+import io
+import json
+import multiprocessing
+import os
+import time
+from contextlib import redirect_stdout
+from grammar.semgus_parser import SemGusParser
+from solver.portfolio import engine_solver
+from main import add_cache_arguments, add_solver_arguments, conversion_cache, solution_cache, solver_options
+
+# Summary status of each SynthesisResult status; timeout and unknown keep theirs
+STATUSES = {"sat": "solved", "unsat": "no_solution"}
+
+def find_problems(pattern):
+    """
+    Returns the .sem files in a directory or matching a glob pattern.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.sem")
+    return sorted(glob.glob(pattern))
+
+def json_paths(problems, json_dir):
+    """
+    Gives every problem its own intermediate JSON file in json_dir.
+    """
+    paths = {}
+    used = set()
+    for sem_file in problems:
+        name = os.path.splitext(os.path.basename(sem_file))[0]
+        candidate, suffix = name, 1
+        while candidate in used:
+            suffix += 1
+            candidate = "%s_%d" % (name, suffix)
+        used.add(candidate)
+        paths[sem_file] = os.path.join(json_dir, candidate + ".json")
+    return paths
+
+def solve_problem(sem_file, json_output, exe_path, cache, options, conn):
+    """
+    Converts, parses and solves one problem, sending its summary over conn.
+    """
+    summary = {"problem": sem_file, "json": json_output, "status": "error",
+               "program": None, "size": None, "times": {}}
+    times = summary["times"]
+    try:
+        # Workers report through their summary only
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            parser = SemGusParser(exe_path, sem_file, json_output, cache)
+            parser.convert_sem_to_json()
+            times["convert"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parser.parse_json()
+            problem = parser.compile_problem()
+            times["parse"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            solver = engine_solver(problem, **options)
+            times["setup"] = time.perf_counter() - start
+
+            result = solver.solve()
+            times["solve"] = result.time
+
+        summary.update(result.to_dict(), status=STATUSES.get(result.status, result.status))
+    except Exception as e:
+        summary["error"] = "%s: %s" % (type(e).__name__, e)
+    conn.send(summary)
+    conn.close()
+
+def run_batch(problems, json_dir, exe_path, options, jobs = None, timeout = None, cache = None):
+    """
+    Solves every problem in its own worker process, at most jobs at a time.
+    A worker still running after timeout seconds is terminated and its
+    problem reported as timed out. Returns the summaries in problem order.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    paths = json_paths(problems, json_dir)
+    os.makedirs(json_dir, exist_ok=True)
+
+    results = {}
+    pending = list(problems)
+    running = {}
+    while pending or running:
+        while pending and len(running) < jobs:
+            sem_file = pending.pop(0)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=solve_problem, args=(sem_file, paths[sem_file], exe_path, cache, options, sender))
+            process.start()
+            sender.close()
+            running[sem_file] = (process, receiver, time.perf_counter())
+
+        for sem_file, (process, receiver, start) in list(running.items()):
+            elapsed = time.perf_counter() - start
+            if receiver.poll():
+                results[sem_file] = receiver.recv()
+            elif not process.is_alive():
+                # The worker may have sent its summary and exited since the poll
+                if receiver.poll():
+                    results[sem_file] = receiver.recv()
+                else:
+                    results[sem_file] = {"status": "error", "error": "worker exited with code %s" % process.exitcode}
+            elif timeout is not None and elapsed > timeout:
+                process.terminate()
+                results[sem_file] = {"status": "timeout"}
+            else:
+                continue
+            process.join()
+            receiver.close()
+            del running[sem_file]
+            summary = results[sem_file]
+            summary.setdefault("problem", sem_file)
+            summary.setdefault("json", paths[sem_file])
+            summary.setdefault("program", None)
+            summary.setdefault("size", None)
+            summary.setdefault("times", {})
+            summary["times"]["total"] = elapsed
+
+        time.sleep(0.01)
+
+    return [results[sem_file] for sem_file in problems]
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a set of SemGus problems concurrently")
+    parser.add_argument("problems", help="Directory or glob pattern of .sem files, e.g. 'input/*.sem'")
+    parser.add_argument("--json_dir", help="Directory for the per-problem intermediate JSON files", default="outputs/batch")
+    parser.add_argument("--summary", help="Path to the JSON results summary", default="outputs/summary.json")
+    parser.add_argument("--exe_path", help="Path to the semgus-parser.exe file", default="tools/semgus-parser.exe")
+    parser.add_argument("--jobs", help="Number of problems solved at once", type=int, default=None)
+    parser.add_argument("--engine", help="smt: linear encoding in Z3, enum: bottom-up enumeration", choices=["smt", "enum"], default="smt")
+    parser.add_argument("--timeout", help="Wall-clock seconds allowed per problem", type=float, default=None)
+    add_cache_arguments(parser)
+    # Sweeps measure the solver, so earlier solutions are only tried on request
+    parser.add_argument("--solution_cache", help="Try the cached programs before synthesizing", dest="no_solution_cache", action="store_false")
+    parser.set_defaults(no_solution_cache=True)
+    add_solver_arguments(parser)
+    args = parser.parse_args()
+
+    problems = find_problems(args.problems)
+    print("Solving %d problems..." % len(problems))
+    if args.engine == "enum":
+        options = {"engine": "enum", "max_size": args.max_size, "timeout": args.solve_timeout}
+    else:
+        options = dict(solver_options(args), solution_cache=solution_cache(args))
+    summaries = run_batch(problems, args.json_dir, args.exe_path, options, args.jobs, args.timeout, conversion_cache(args))
+
+    summary_dir = os.path.dirname(args.summary)
+    if summary_dir:
+        os.makedirs(summary_dir, exist_ok=True)
+    with open(args.summary, 'w') as f:
+        json.dump(summaries, f, indent=2)
+
+    for summary in summaries:
+        print("%s: %s %s" % (summary["problem"], summary["status"], summary["program"] or ""))
+    print("Summary written to %s" % args.summary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from grammar.generator import GeneratedProblem
+from grammar.semgus_parser import SemGusParser
+from solver.profiler import Profiler
+from solver.portfolio import engine_solver
+from main import add_solver_arguments, solver_options
+
+def _grid(values):
+    return [int(v) for v in values.split(",")]
+
+def generate_suite(examples, widths, sizes, directory, seed = 0, sem = False):
+    """
+    Writes one generated problem per combination of example count, grammar
+    width and target size to directory as semgus JSON events (and as .sem
+    if sem is set). Returns (name, json path, target size) per problem.
+    """
+    os.makedirs(directory, exist_ok=True)
+    cases = []
+    for e in examples:
+        for w in widths:
+            for s in sizes:
+                problem = GeneratedProblem(e, w, s, seed)
+                path = os.path.join(directory, problem.name + ".json")
+                problem.write_json(path)
+                if sem:
+                    problem.write_sem(os.path.join(directory, problem.name + ".sem"))
+                cases.append((problem.name, path, s))
+    return cases
+
+def run_once(job):
+    """
+    Parses and solves one problem in the current (fresh) process and
+    returns its phase times and peak memory.
+    """
+    path, options = job
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        parser = SemGusParser(json_output=path)
+        parser.parse_json()
+        problem = parser.compile_problem()
+        profiler = Profiler()
+        solver = engine_solver(problem, profiler=profiler, **options)
+        result = solver.solve()
+    times = profiler.times
+    checks = profiler.checks
+    return {
+        "program": result.program,
+        "total": time.perf_counter() - start,
+        "encode": times.get("encode", 0.0),
+        "check": times.get("check", 0.0),
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "z3_max_memory_mb": checks[-1]["statistics"].get("max memory") if checks else None,
+    }
+
+def run_benchmark(cases, options, repeats = 3):
+    """
+    Runs every case repeats times, each run in its own process so that
+    memory peaks and solver state do not carry over. Reports the median of
+    each measurement per case.
+    """
+    results = {}
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        for name, path, size in cases:
+            case_options = dict(options, max_size=size)
+            runs = pool.map(run_once, [(path, case_options)] * repeats, chunksize=1)
+            result = {key: statistics.median([run[key] for run in runs])
+                      for key in ("total", "encode", "check", "max_rss_mb")}
+            result["z3_max_memory_mb"] = max([run["z3_max_memory_mb"] or 0 for run in runs])
+            result["solved"] = all(run["program"] is not None for run in runs)
+            result["runs"] = repeats
+            results[name] = result
+            print("%s: %s total %.3fs encode %.3fs check %.3fs rss %.1fMB" % (
+                name, "solved" if result["solved"] else "unsolved",
+                result["total"], result["encode"], result["check"], result["max_rss_mb"]))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def compare(results, baseline, tolerance = 0.25, slack = 0.05):
+    """
+    Returns a description of every regression against the baseline: a case
+    that no longer solves, or whose median encode or total time grew by
+    more than tolerance (relative) and slack seconds. Cases missing from
+    either side are ignored.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if base.get("solved") and not result["solved"]:
+            regressions.append("%s: no longer solved" % name)
+        for key in ("encode", "total"):
+            if result[key] > base[key] * (1 + tolerance) and result[key] - base[key] > slack:
+                regressions.append("%s: %s %.3fs, baseline %.3fs" % (name, key, result[key], base[key]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SemGusSolver on generated problems")
+    parser.add_argument("--examples", help="Comma separated example counts", type=_grid, default=[2, 20, 100])
+    parser.add_argument("--widths", help="Comma separated grammar widths (number of constructors)", type=_grid, default=[4, 6])
+    parser.add_argument("--sizes", help="Comma separated target program sizes", type=_grid, default=[2, 3])
+    parser.add_argument("--generator_seed", help="Seed of the problem generator", type=int, default=0)
+    parser.add_argument("--repeats", help="Runs per problem; the median is reported", type=int, default=3)
+    parser.add_argument("--problem_dir", help="Directory for the generated problems", default="outputs/benchmark")
+    parser.add_argument("--sem", help="Also write the generated problems as .sem files", action="store_true")
+    parser.add_argument("--output", help="Path to the JSON results", default="outputs/benchmark.json")
+    parser.add_argument("--baseline", help="JSON results to compare against; regressions fail the run", default=None)
+    parser.add_argument("--save_baseline", help="Write the results to --baseline instead of comparing", action="store_true")
+    parser.add_argument("--engine", help="smt: linear encoding in Z3, enum: bottom-up enumeration", choices=["smt", "enum"], default="smt")
+    parser.add_argument("--tolerance", help="Allowed relative slowdown against the baseline", type=float, default=0.25)
+    add_solver_arguments(parser)
+    args = parser.parse_args()
+
+    # Each problem is solved up to its own target size
+    options = solver_options(args) if args.engine == "smt" else {"engine": "enum"}
+    cases = generate_suite(args.examples, args.widths, args.sizes, args.problem_dir, args.generator_seed, args.sem)
+    results = run_benchmark(cases, options, args.repeats)
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Results written to %s" % args.output)
+
+    if args.baseline is None:
+        return
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Baseline written to %s" % args.baseline)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("Regression: " + regression)
+    if regressions:
+        sys.exit(1)
+    print("No regressions against %s" % args.baseline)
+
+if __name__ == "__main__":
+    main()
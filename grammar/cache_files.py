@@ -0,0 +1,47 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_writer(path):
+    """
+    Yields a text file that replaces path once the block exits normally;
+    the file is discarded if the block raises.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Concurrent writers each publish a complete file atomically
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            yield f
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+
+def evict(directory, max_bytes):
+    """
+    Removes the .json entries under directory least recently used first
+    (by mtime) until they take at most max_bytes.
+    """
+    entries = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(".json"):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
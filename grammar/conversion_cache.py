@@ -0,0 +1,89 @@
+import hashlib
+import os
+import shutil
+from contextlib import contextmanager
+from grammar.cache_files import atomic_writer, evict
+
+# Bumped whenever the converter is invoked differently
+CACHE_FORMAT = "json-batch-1"
+
+class ConversionCache:
+    """
+    Content-addressed store of converted .sem files. Entries are keyed on
+    the .sem contents and the converter executable, hold the converted
+    event stream as written by semgus-parser.exe, and are evicted least
+    recently used first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Converter hashes by (path, size, mtime), so each executable is read once
+        self._exe_hashes = {}
+
+    def key(self, sem_file, exe_path):
+        """
+        Returns the cache key of converting sem_file with exe_path.
+        """
+        digest = hashlib.sha256()
+        digest.update(CACHE_FORMAT.encode())
+        digest.update(self._exe_hash(exe_path).encode())
+        with open(sem_file, 'rb') as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+
+    def _exe_hash(self, exe_path):
+        stat = os.stat(exe_path)
+        version = (os.path.abspath(exe_path), stat.st_size, stat.st_mtime_ns)
+        if version not in self._exe_hashes:
+            digest = hashlib.sha256()
+            with open(exe_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self._exe_hashes[version] = digest.hexdigest()
+        return self._exe_hashes[version]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def lookup(self, key):
+        """
+        Returns the path of the cached conversion, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            # Marks the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, key, destination):
+        """
+        Copies the cached conversion to destination. Returns False on a miss.
+        """
+        path = self.lookup(key)
+        if path is None:
+            return False
+        try:
+            shutil.copyfile(path, destination)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key, source):
+        """
+        Stores the conversion written to source and evicts old entries.
+        """
+        with self.writer(key) as entry, open(source, 'r') as f:
+            shutil.copyfileobj(f, entry)
+
+    @contextmanager
+    def writer(self, key):
+        """
+        Yields a text file that becomes the entry for key once the block
+        exits normally; the entry is discarded if the block raises.
+        """
+        with atomic_writer(self._path(key)) as entry:
+            yield entry
+        evict(self.directory, self.max_bytes)
@@ -0,0 +1,195 @@
+import json
+import random
+
+# Constructors of the generated grammar in the order they are added as the
+# width grows: (name, operator, value). Operators are kept monotone so that
+# every line stays non-negative on non-negative inputs.
+CONSTRUCTORS = [
+    ("$x", "var", "x"),
+    ("$y", "var", "y"),
+    ("$+", "+", None),
+    ("$1", "const", 1),
+    ("$*", "*", None),
+    ("$0", "const", 0),
+]
+
+INPUTS = ["x", "y"]
+
+# Largest value a generated program may compute on an example
+MAX_VALUE = 10 ** 9
+
+def constructors(width):
+    """
+    Returns the first width constructors; widths beyond the fixed pool are
+    filled with further integer constants.
+    """
+    if width < 3:
+        raise ValueError("A generated grammar needs at least 3 constructors, got %d" % width)
+    pool = list(CONSTRUCTORS)
+    k = 2
+    while len(pool) < width:
+        pool.append(("$%d" % k, "const", k))
+        k += 1
+    return pool[:width]
+
+class GeneratedProblem:
+    """
+    A synthetic SemGus problem over a single integer nonterminal E with
+    inputs x and y. The specification is sampled from a planted program of
+    exactly size lines, each line combining the previous one with an
+    earlier line or leaf, so a solution of that size always exists.
+    """
+
+    def __init__(self, examples, width, size, seed = 0, value_range = 10):
+        self.examples = examples
+        self.width = width
+        self.size = size
+        self.seed = seed
+        self.name = "e%d_w%d_s%d_seed%d" % (examples, width, size, seed)
+        self.constructors = constructors(width)
+
+        rng = random.Random(seed)
+        leaves = [c for c in self.constructors if c[1] in ("var", "const")]
+        operators = [c for c in self.constructors if c[1] in ("+", "*")]
+
+        self.inputs = [{var: rng.randrange(value_range) for var in INPUTS} for _ in range(examples)]
+
+        # Planted program as lines (constructor, child lines). Products
+        # that would leave the int64 range of the compiled examples are
+        # replaced by sums.
+        self.lines = [(rng.choice(leaves), [])]
+        while len(self.lines) < size:
+            l = len(self.lines)
+            line = (rng.choice(operators), [l - 1, rng.randrange(l)])
+            self.lines.append(line)
+            if line[0][1] == "*" and max([self.evaluate(inputs) for inputs in self.inputs], default=0) > MAX_VALUE:
+                self.lines[-1] = (operators[0], line[1])
+
+        self.outputs = [self.evaluate(inputs) for inputs in self.inputs]
+
+    def evaluate(self, inputs):
+        values = []
+        for (_, operator, value), child_lines in self.lines:
+            if operator == "var":
+                values.append(inputs[value])
+            elif operator == "const":
+                values.append(value)
+            elif operator == "+":
+                values.append(values[child_lines[0]] + values[child_lines[1]])
+            else:
+                values.append(values[child_lines[0]] * values[child_lines[1]])
+        return values[-1]
+
+    def program(self):
+        """
+        Returns the planted program in the format of SemGusSolver.build_program.
+        """
+        def build(l):
+            (name, _, _), child_lines = self.lines[l]
+            if not child_lines:
+                return " " + name[1:] + " "
+            return name[1:] + " ( " + "".join(build(c) for c in child_lines) + " ) "
+        return build(len(self.lines) - 1)
+
+    def to_sem(self):
+        """
+        Returns the problem in .sem syntax, to be converted by semgus-parser.exe.
+        """
+        rules = []
+        for name, operator, value in self.constructors:
+            if operator == "var":
+                rules.append("(%s (= r %s))" % (name, value))
+            elif operator == "const":
+                rules.append("(%s (= r %d))" % (name, value))
+            else:
+                rules.append("((%s et1 et2) (exists ((r1 Int) (r2 Int)) (and (E.Sem et1 x y r1) (E.Sem et2 x y r2) (= r (%s r1 r2)))))"
+                             % (name, operator))
+        syntax = " ".join("(%s E E)" % name if operator in ("+", "*") else "(%s)" % name
+                          for name, operator, _ in self.constructors)
+
+        text = [
+            ";; Generated problem %s (seed %d)" % (self.name, self.seed),
+            "(declare-term-types",
+            "  ((E 0))",
+            "  ((%s)))" % syntax,
+            "(define-funs-rec",
+            "  ((E.Sem ((t_e E) (x Int) (y Int) (r Int)) Bool))",
+            "  ((! (match t_e",
+            "        (%s))" % "\n         ".join(rules),
+            "     :input (x y) :output (r))))",
+            "(synth-fun f () E)",
+        ]
+        for inputs, output in zip(self.inputs, self.outputs):
+            text.append("(constraint (E.Sem f %d %d %d))" % (inputs["x"], inputs["y"], output))
+        text.append("(check-synth)")
+        return "\n".join(text) + "\n"
+
+    def to_events(self):
+        """
+        Returns the problem as the semgus JSON events semgus-parser.exe
+        would produce, so it can be parsed without the converter.
+        """
+        sorts = ["E", "Int", "Int", "Int"]
+        inputs = [{"id": var, "sort": "Int", "index": i + 1} for i, var in enumerate(INPUTS)]
+        events = [
+            {"name": "E", "$event": "declare-term-type", "$type": "semgus"},
+            {"name": "E", "constructors": [
+                {"name": name, "children": ["E", "E"] if operator in ("+", "*") else []}
+                for name, operator, _ in self.constructors],
+             "$event": "define-term-type", "$type": "semgus"},
+            {"name": "E.Sem", "rank": {"argumentSorts": sorts, "returnSort": "Bool"},
+             "$event": "declare-function", "$type": "smt"},
+            {"name": "E.Sem", "rank": {"argumentSorts": sorts, "returnSort": "Bool"},
+             "definition": {"arguments": ["t_e", "x", "y", "r"], "$termType": "lambda"},
+             "$event": "define-function", "$type": "smt"},
+        ]
+
+        def variable(name):
+            return {"name": name, "sort": "Int", "$termType": "variable"}
+
+        def relation(term, output):
+            return {"name": "E.Sem", "signature": sorts, "arguments": [term] + INPUTS + [output]}
+
+        for i, (name, operator, value) in enumerate(self.constructors):
+            if operator == "var":
+                rhs, body, children = variable(value), [], []
+            elif operator == "const":
+                rhs, body, children = value, [], []
+            else:
+                rhs = {"name": operator, "returnSort": "Int", "argumentSorts": ["Int", "Int"],
+                       "arguments": [variable("r1"), variable("r2")], "$termType": "application"}
+                body = [relation("et1", "r1"), relation("et2", "r2")]
+                children = ["et1", "et2"]
+            events.append({
+                "id": "_CHC-%s-%d" % (name, i),
+                "head": relation("t_e", "r"),
+                "bodyRelations": body,
+                "inputVariables": list(INPUTS),
+                "outputVariables": ["r"],
+                "variables": ["t_e"] + INPUTS + ["r"] + ["r%d" % (k + 1) for k in range(len(children))],
+                "constraint": {"name": "=", "returnSort": "Bool", "argumentSorts": ["Int", "Int"],
+                               "arguments": [variable("r"), rhs], "$termType": "application"},
+                "constructor": {"name": name, "arguments": children,
+                                "argumentSorts": ["E"] * len(children), "returnSort": "E"},
+                "symbols": {
+                    "inputs": inputs,
+                    "outputs": [{"id": "r", "sort": "Int", "index": 3}],
+                    "term": {"id": "t_e", "sort": "E", "index": 0},
+                },
+                "$event": "chc", "$type": "semgus",
+            })
+
+        events.append({"name": "f", "termType": "E", "$event": "synth-fun", "$type": "semgus"})
+        for inputs, output in zip(self.inputs, self.outputs):
+            events.append({"constraint": {"name": "E.Sem", "arguments": [{"name": "f"}, inputs["x"], inputs["y"], output]},
+                           "$event": "constraint", "$type": "semgus"})
+        events.append({"$event": "check-synth", "$type": "semgus"})
+        return events
+
+    def write_sem(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_sem())
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_events(), f)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import numpy as np
+
+# Operators the semantic templates may use, see compile_semantics
+SUPPORTED_OPERATORS = {"+", "-", "*", "/", "<", ">", "==", "not", "and", "ite"}
+
+# Booleans are represented as the integers 1 (true) and 0 (false)
+BOOL_CONSTANTS = {"true": 1, "false": 0}
+
+def _name(arg):
+    return arg["name"] if isinstance(arg, dict) else arg
+
+def _value(arg):
+    name = _name(arg)
+    return BOOL_CONSTANTS.get(name, name)
+
+def compile_semantics(semantics, children):
+    """
+    Compiles the CHCs parsed by SemGusParser into one semantic template per
+    production: (output symbol, operator, operands). Leaves use the
+    operators 'var' and 'const' with the input name or constant value as
+    operand, every other operator lists the child indices its operands are
+    read from. A constructor with two CHCs is treated as an ite on its
+    children. Productions whose semantics are not understood are left out.
+    """
+    templates = {}
+
+    chc_counts = {}
+    for chc in semantics.values():
+        production = chc["constructor"]["name"]
+        chc_counts[production] = chc_counts.get(production, 0) + 1
+
+    for chc in semantics.values():
+        production = chc["constructor"]["name"]
+        output = chc["symbols"]["outputs"][0]["id"]
+        inputs = [i["id"] for i in chc["symbols"]["inputs"]]
+
+        if chc_counts[production] > 1:
+            templates[production] = (output, "ite", tuple(range(len(children[production]))))
+            continue
+
+        constraint = chc["constraint"]
+        if constraint["name"] != "=" or _name(constraint["arguments"][0]) != output:
+            continue
+
+        rhs = constraint["arguments"][1]
+        if isinstance(rhs, bool) or not isinstance(rhs, (int, dict)):
+            continue
+        if isinstance(rhs, int):
+            templates[production] = (output, "const", rhs)
+        elif rhs["name"] in inputs:
+            templates[production] = (output, "var", rhs["name"])
+        elif rhs["name"] in BOOL_CONSTANTS:
+            templates[production] = (output, "const", BOOL_CONSTANTS[rhs["name"]])
+        elif rhs["name"] in SUPPORTED_OPERATORS:
+            # Each operand is the output of a body relation, whose term
+            # argument identifies the child it is read from
+            child_terms = chc["constructor"]["arguments"]
+            child_outputs = {}
+            for rel in chc["bodyRelations"]:
+                if rel["arguments"][0] in child_terms:
+                    child_outputs[rel["arguments"][-1]] = child_terms.index(rel["arguments"][0])
+            operands = []
+            for k, arg in enumerate(rhs["arguments"]):
+                operands.append(child_outputs.get(_name(arg), k))
+            templates[production] = (output, rhs["name"], tuple(operands))
+
+    return templates
+
+class Problem:
+    """
+    Compiled, integer-indexed form of a parsed SemGus problem. It is built
+    once from the SemGusParser output and shared by every solver, size and
+    worker, so encoding never walks the parsed JSON again.
+
+    Nonterminals and productions are numbered in grammar order; children,
+    nt_prods and templates are lists indexed by production or nonterminal,
+    and nt_index/prod_index are the reverse maps from names. The examples
+    are stored column-wise: inputs maps each input variable to an int64
+    array over the examples, and outputs holds the expected outputs.
+    """
+
+    __slots__ = (
+        "nonterminals", "nt_index", "productions", "prod_index", "prod_nt",
+        "nt_prods", "children", "max_arity", "templates", "start",
+        "input_vars", "output_var", "inputs", "outputs", "num_examples",
+    )
+
+    def __init__(self, grammar, semantics, specification, functions, synth_fun):
+        self.nonterminals = list(grammar)
+        self.nt_index = {nt: i for i, nt in enumerate(self.nonterminals)}
+
+        self.productions = []
+        self.prod_nt = []
+        self.children = []
+        child_names = {}
+        for nonterminal, production in grammar.items():
+            for i in production['constructors']:
+                self.productions.append(i['name'])
+                self.prod_nt.append(self.nt_index[nonterminal])
+                self.children.append(tuple(self.nt_index[ch] for ch in i['children']))
+                child_names[i['name']] = i['children']
+        self.prod_index = {prod: p for p, prod in enumerate(self.productions)}
+        self.nt_prods = [tuple(p for p, nt in enumerate(self.prod_nt) if nt == n)
+                         for n in range(len(self.nonterminals))]
+        self.max_arity = max([len(child) for child in self.children], default=0)
+        self.start = self.nt_index[synth_fun["termType"]]
+
+        templates = compile_semantics(semantics, child_names)
+        self.templates = [templates.get(prod) for prod in self.productions]
+
+        # Inputs and output of each semantic relation. The signature is
+        # that of the start nonterminal's relation, so a problem without
+        # examples still has a column per input
+        symbols = {}
+        self.input_vars = ()
+        self.output_var = None
+        for chc in semantics.values():
+            inputs = tuple(i["id"] for i in chc["symbols"]["inputs"])
+            output = chc["symbols"]["outputs"][0]["id"]
+            symbols[chc["head"]["name"]] = (inputs, output)
+            if chc["symbols"]["term"]["sort"] == synth_fun["termType"] and self.output_var is None:
+                self.input_vars, self.output_var = inputs, output
+
+        columns = {var: [] for var in self.input_vars}
+        outputs = []
+        for constraint in specification:
+            inputs, output = symbols[constraint["name"]]
+            if self.output_var is None:
+                self.input_vars, self.output_var = inputs, output
+            values = dict(zip(functions[constraint["name"]], constraint["arguments"]))
+            for var in inputs:
+                columns.setdefault(var, []).append(_value(values[var]))
+            outputs.append(_value(values[output]))
+
+        self.num_examples = len(outputs)
+        self.inputs = {var: np.array(column, dtype=np.int64) for var, column in columns.items()}
+        self.outputs = np.array(outputs, dtype=np.int64)
+
+    def grammar_fingerprint(self):
+        """
+        Returns a hash of the grammar, semantics and signature, identifying
+        problems whose programs are interchangeable.
+        """
+        canonical = json.dumps([self.nonterminals, self.productions, self.children, self.templates,
+                                self.start, self.input_vars, self.output_var])
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def example_rows(self):
+        """
+        Returns the set of examples as (inputs in input_vars order..., output) tuples.
+        """
+        columns = [self.inputs[var] for var in self.input_vars] + [self.outputs]
+        return set(map(tuple, np.column_stack(columns).tolist())) if self.num_examples else set()
+
+    def examples_fingerprint(self):
+        """
+        Returns a hash of the examples, independent of their order and duplicates.
+        """
+        canonical = json.dumps(sorted(self.example_rows()))
+        return hashlib.sha256(canonical.encode()).hexdigest()
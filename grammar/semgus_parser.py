@@ -1,15 +1,54 @@
 import json
 import subprocess
 import os
+import tempfile
+from grammar.problem import Problem
+
+def iter_events(stream, chunk_size=1 << 16, tee=None):
+    """
+    Yields the events of a semgus JSON event array one at a time as they are
+    read from stream, without loading the whole array. Concatenated or
+    newline-delimited events are accepted as well. Every chunk read is also
+    written to tee, if given.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        # Skip the array brackets, separators and whitespace between events
+        while pos < len(buffer) and buffer[pos] in "[], \t\r\n":
+            pos += 1
+
+        if pos < len(buffer):
+            try:
+                event, pos = decoder.raw_decode(buffer, pos)
+                yield event
+                continue
+            except json.JSONDecodeError:
+                # The event is still incomplete
+                if eof:
+                    raise
+        elif eof:
+            return
+
+        chunk = stream.read(chunk_size)
+        if tee is not None:
+            tee.write(chunk)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
 
 class SemGusParser:
-    def __init__(self, exe_path=None, sem_file=None, json_output=None):
+    def __init__(self, exe_path=None, sem_file=None, json_output=None, cache=None):
         """
         Initialize the parser with optional paths for conversion and parsing.
+        An optional ConversionCache lets unchanged .sem files skip the converter.
         """
         self.exe_path = exe_path
         self.sem_file = sem_file
         self.json_output = json_output
+        self.cache = cache
         self.grammar = {}
         self.semantic_rules = {}
         self.specification = []
@@ -21,64 +60,142 @@ class SemGusParser:
         output_dir = os.path.dirname(self.json_output)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
+
+        if self.cache is not None:
+            key = self.cache.key(self.sem_file, self.exe_path)
+            if self.cache.get(key, self.json_output):
+                print("Conversion cache hit!")
+                return
         
         # Construct the command to run semgus-parser.exe
-        command = [
-            self.exe_path,
-            "--format", "json",
-            "--mode", "batch",
-            "--output", self.json_output,
-            "--", self.sem_file
-        ]
+        command = self._command(self.json_output)
         
         try:
             # Run the command and capture output
             result = subprocess.run(command, capture_output=True, text=True, check=True)
             print("Conversion successful!")
+            if self.cache is not None:
+                self.cache.put(key, self.json_output)
         except subprocess.CalledProcessError as e:
             print(f"Error during conversion: {e}")
             print("Standard Output:", e.stdout)
             print("Standard Error:", e.stderr)
 
-    def parse_json(self):
+    def _command(self, output=None):
+        """
+        Returns the semgus-parser.exe command line; without an output file
+        the events are written to stdout.
+        """
+        command = [
+            self.exe_path,
+            "--format", "json",
+            "--mode", "batch",
+        ]
+        if output is not None:
+            command += ["--output", output]
+        return command + ["--", self.sem_file]
+
+    def stream_sem(self):
+        """
+        Runs semgus-parser.exe and parses its events from the stdout pipe
+        while the converter is still running, without an intermediate JSON
+        file. A conversion cache, if any, is filled from the same pipe.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(self.sem_file, self.exe_path)
+            cached = self.cache.lookup(key)
+            if cached is not None:
+                print("Conversion cache hit!")
+                self.parse_json(cached)
+                return
+
+        with tempfile.TemporaryFile(mode='w+') as stderr:
+            process = subprocess.Popen(self._command(), stdout=subprocess.PIPE, stderr=stderr, text=True)
+            try:
+                if key is not None:
+                    with self.cache.writer(key) as entry:
+                        self._parse_process(process, stderr, tee=entry)
+                else:
+                    self._parse_process(process, stderr)
+                print("Conversion successful!")
+            except subprocess.CalledProcessError as e:
+                print(f"Error during conversion: {e}")
+                print("Standard Error:", e.stderr)
+            finally:
+                process.stdout.close()
+                process.wait()
+
+    def _parse_process(self, process, stderr, tee=None):
+        try:
+            self.parse_stream(process.stdout, tee=tee)
+        except ValueError:
+            # A converter failing partway leaves truncated JSON behind; its
+            # exit code and stderr explain the failure, the parse error not
+            process.stdout.read()
+            self._wait(process, stderr)
+            raise
+        self._wait(process, stderr)
+
+    def _wait(self, process, stderr):
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr.read())
+
+    def parse_json(self, path=None):
         """
         Parses the JSON file into abstract data structures (grammar, semantics, and specification).
+        Events are read and dispatched one at a time.
+        """
+        path = path or self.json_output
+        if not path or not os.path.exists(path):
+            raise FileNotFoundError(f"JSON file '{path}' does not exist.")
+
+        with open(path, 'r') as f:
+            self.parse_stream(f)
+
+    def parse_stream(self, stream, tee=None):
+        """
+        Parses the events of a text stream as they arrive.
+        """
+        self.parse_events(iter_events(stream, tee=tee))
+
+    def parse_events(self, events):
+        """
+        Parses already decoded events, e.g. a semgus JSON event array.
+        """
+        for event in events:
+            self._dispatch(event)
+
+    def _dispatch(self, event):
+        event_type = event.get("$event")
+        
+        # Grammar-related events
+        if event_type in {"declare-term-type", "define-term-type"}:
+            self._parse_term_type(event)
+        elif event_type in {"define-function"}:
+            self._parse_function(event)
+
+        # Semantic rules
+        elif event_type == "chc":
+            self._parse_chc(event)
+
+        # Specification
+        elif event_type == "constraint":
+            self._parse_constraint(event)
+
+        elif event_type == "synth-fun":
+            self._parse_synth_function(event)
+
+        # Synthesis-related (still part of specification
+        """"
+        elif event_type == "synth-fun":
+            self._parse_synth_function(event)
+        elif event_type == "check-synth":
+            self._handle_check_synth(event)
+        elif event_type == "end-of-stream":
+            self._handle_end_of_stream(event)
         """
-        if not self.json_output or not os.path.exists(self.json_output):
-            raise FileNotFoundError(f"JSON file '{self.json_output}' does not exist.")
-
-        with open(self.json_output, 'r') as f:
-            semgus_data = json.load(f)
-
-        for event in semgus_data:
-            event_type = event.get("$event")
-            
-            # Grammar-related events
-            if event_type in {"declare-term-type", "define-term-type"}:
-                self._parse_term_type(event)
-            elif event_type in {"define-function"}:
-                self._parse_function(event)
-
-            # Semantic rules
-            elif event_type == "chc":
-                self._parse_chc(event)
-
-            # Specification
-            elif event_type == "constraint":
-                self._parse_constraint(event)
-
-            elif event_type == "synth-fun":
-                self._parse_synth_function(event)
-
-            # Synthesis-related (still part of specification
-            """"
-            elif event_type == "synth-fun":
-                self._parse_synth_function(event)
-            elif event_type == "check-synth":
-                self._handle_check_synth(event)
-            elif event_type == "end-of-stream":
-                self._handle_end_of_stream(event)
-            """
 
     def _parse_term_type(self, event):
         """
@@ -158,6 +275,12 @@ class SemGusParser:
     def get_specification(self):
         return self.specification
 
+    def compile_problem(self):
+        """
+        Returns the parsed problem compiled into its indexed Problem form.
+        """
+        return Problem(self.grammar, self.semantic_rules, self.specification, self.functions, self.synth_fun)
+
     def convert_and_parse(self):
         """
         End-to-end function: Converts .sem to .json and parses the JSON data.
@@ -1,9 +1,88 @@
 import argparse
+import json
 import os
 from grammar.semgus_parser import SemGusParser
+from grammar.conversion_cache import ConversionCache
 from solver.solver import SemGusSolver
+from solver.portfolio import default_configs, engine_solver, solve_portfolio
+from solver.profiler import Profiler
+from solver.solution_cache import SolutionCache
 #from src.solver import SemGusSolver
 
+def add_cache_arguments(parser):
+    """
+    Adds the options that configure the .sem to JSON conversion cache.
+    """
+    parser.add_argument("--cache_dir", help="Directory of the .sem to JSON conversion cache", default="outputs/cache")
+    parser.add_argument("--cache_size", help="Maximum size of the conversion cache in megabytes", type=int, default=256)
+    parser.add_argument("--no_cache", help="Always run the converter", action="store_true")
+    parser.add_argument("--solution_dir", help="Directory of the cache of synthesized programs", default="outputs/solutions")
+    parser.add_argument("--solution_cache_size", help="Maximum size of the solution cache in megabytes", type=int, default=64)
+    parser.add_argument("--no_solution_cache", help="Always synthesize, without trying earlier solutions", action="store_true")
+
+def conversion_cache(args):
+    """
+    Returns the conversion cache selected on the command line, if any.
+    """
+    if args.no_cache:
+        return None
+    return ConversionCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+def solution_cache(args):
+    """
+    Returns the solution cache selected on the command line, if any.
+    """
+    if args.no_solution_cache:
+        return None
+    return SolutionCache(args.solution_dir, args.solution_cache_size * 1024 * 1024)
+
+def add_solver_arguments(parser):
+    """
+    Adds the options that configure SemGusSolver.
+    """
+    parser.add_argument("--max_size", help="Maximum number of program lines", type=int, default=4)
+    parser.add_argument("--incremental", help="Grow the program size from 1 up to max_size", action="store_true")
+    parser.add_argument("--cegis", help="Solve against a working set of examples grown from counterexamples", action="store_true")
+    parser.add_argument("--encoding", help="Sorts used for line, nonterminal and production indices", choices=["int", "bv", "enum"], default="int")
+    parser.add_argument("--constants", help="Use one constant per line and example instead of uninterpreted functions", action="store_true")
+    parser.add_argument("--symmetry_breaking", help="Add constraints ruling out equivalent programs and unreachable productions", action="store_true")
+    parser.add_argument("--lazy", help="Assert the semantics of a line only once a model uses its production", action="store_true")
+    parser.add_argument("--optimize", help="Return a provably cheapest program of at most max_size lines, by used lines or by production costs (see --costs)", choices=["size", "cost"], default=None)
+    parser.add_argument("--costs", help="JSON file mapping production names to costs, for --optimize cost and --order cost", default=None)
+    parser.add_argument("--seed", help="Random seed of the Z3 solver", type=int, default=None)
+    parser.add_argument("--tactic", help="Z3 tactic the solver is built from", default=None)
+    parser.add_argument("--solve_timeout", help="Wall-clock seconds allowed per solve; a solve out of time reports timeout", type=float, default=None)
+    parser.add_argument("--max_memory", help="Memory allowed to Z3 in megabytes; a solve out of memory reports unknown", type=int, default=None)
+
+def load_costs(path):
+    """
+    Returns the production costs in the JSON file at path, if any.
+    """
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def solver_options(args):
+    """
+    Returns the SemGusSolver keyword arguments selected on the command line.
+    """
+    return {
+        "max_size": args.max_size,
+        "incremental": args.incremental,
+        "cegis": args.cegis,
+        "encoding": args.encoding,
+        "constants": args.constants,
+        "symmetry_breaking": args.symmetry_breaking,
+        "lazy": args.lazy,
+        "optimize": args.optimize,
+        "costs": load_costs(args.costs),
+        "seed": args.seed,
+        "tactic": args.tactic,
+        "timeout": args.solve_timeout,
+        "max_memory": args.max_memory,
+    }
+
 def main():
 
     print("Starting SemGus Solver...")
@@ -13,25 +92,80 @@ def main():
     parser.add_argument("--json_output", help="Path to the intermediate JSON file", default="outputs/problem.json")
     parser.add_argument("--solution_output", help="Path to the solver's output", default="outputs/solution.json")
     parser.add_argument("--exe_path", help="Path to the semgus-parser.exe file", default="tools/semgus-parser.exe")
+    parser.add_argument("--stream", help="Parse the converter's output from its stdout pipe instead of the intermediate JSON file", action="store_true")
+    add_cache_arguments(parser)
+    add_solver_arguments(parser)
+    parser.add_argument("--engine", help="smt: linear encoding in Z3, enum: bottom-up enumeration, race: both in parallel", choices=["smt", "enum", "race"], default="smt")
+    parser.add_argument("--solutions", help="Number of distinct programs to find", type=int, default=None)
+    parser.add_argument("--order", help="Order of the programs found with --solutions", choices=["size", "cost"], default="size")
+    parser.add_argument("--portfolio", help="Race several solver configurations in a process pool", action="store_true")
+    parser.add_argument("--processes", help="Number of portfolio worker processes", type=int, default=None)
+    parser.add_argument("--profile", help="Write phase times, counters and Z3 statistics to this JSON file and run the encoding under cProfile", nargs="?", const="outputs/profile.json", default=None)
     args = parser.parse_args()
-    
-    # Convert .sem file to JSON using semgus-parser.exe
-    #if not os.path.exists(args.json_output):
-    print("Converting .sem to JSON...")
-    parser = SemGusParser(args.exe_path, args.sem_file, args.json_output)
-    parser.convert_sem_to_json()
-
-    parser = SemGusParser(args.exe_path, args.sem_file, args.json_output)
-    parser.parse_json()
-
-    solver = SemGusSolver(
-        grammar=parser.grammar,
-        semantics=parser.semantic_rules,
-        specification=parser.specification,
-        functions=parser.functions,
-        synth_fun=parser.synth_fun
-    )
-    solver.solve()
+
+    # Convert .sem file to JSON using semgus-parser.exe, unless the
+    # conversion cache already holds this .sem file
+    profiler = Profiler(cprofile=args.profile is not None)
+    parser = SemGusParser(args.exe_path, args.sem_file, args.json_output, conversion_cache(args))
+    if args.stream:
+        print("Converting and parsing .sem...")
+        with profiler.phase("convert"):
+            parser.stream_sem()
+    else:
+        print("Converting .sem to JSON...")
+        with profiler.phase("convert"):
+            parser.convert_sem_to_json()
+        with profiler.phase("parse"):
+            parser.parse_json()
+    if not parser.synth_fun:
+        # The conversion failed and has been reported
+        print("No synth-fun found in the problem")
+        return
+    with profiler.phase("compile"):
+        problem = parser.compile_problem()
+
+    if args.portfolio or args.engine == "race":
+        print("Solving portfolio...")
+        processes = args.processes
+        if args.portfolio:
+            configs = default_configs(args.max_size, cegis=args.cegis, timeout=args.solve_timeout, max_memory=args.max_memory)
+        else:
+            # One worker per engine, so that neither waits for the other
+            configs = [solver_options(args), {"engine": "enum", "max_size": args.max_size, "timeout": args.solve_timeout}]
+            processes = processes or len(configs)
+        with profiler.phase("solve"):
+            result, config = solve_portfolio(
+                problem=problem,
+                configs=configs,
+                processes=processes
+            )
+        # The workers profile themselves; the report adds up the phase
+        # times and counters of the configuration reported
+        profiler.add(result.stats)
+        if config is not None:
+            print("Configuration: %s" % config)
+        print(result.describe())
+    else:
+        if args.engine == "enum":
+            solver = engine_solver(problem, "enum", max_size=args.max_size, timeout=args.solve_timeout, profiler=profiler)
+        else:
+            solver = SemGusSolver(problem=problem, profiler=profiler, solution_cache=solution_cache(args), **solver_options(args))
+        with profiler.phase("solve"):
+            if args.solutions and args.engine == "smt":
+                print("Solving...")
+                result = solver.solutions(args.solutions, args.order, load_costs(args.costs))
+                for i, solution in enumerate(result.solutions):
+                    print("Solution %d (size %d, cost %s):" % (i + 1, solution["size"], solution["cost"]))
+                    print(solution["program"])
+                if not result.solutions or result.status in ("timeout", "unknown"):
+                    print(result.describe())
+            else:
+                print("Solving...")
+                print(solver.solve().describe())
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+        print("Profile written to %s" % args.profile)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,243 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from grammar.semgus_parser import SemGusParser
+from solver.portfolio import engine_solver
+from solver.solver import SemGusSolver
+from main import add_cache_arguments, conversion_cache, solution_cache
+from batch import STATUSES
+
+class WarmSolvers:
+    """
+    The solvers of one worker, keyed by grammar fingerprint and options and
+    evicted least recently used first beyond max_solvers. A request whose
+    grammar and options match an earlier one reuses that solver, so only
+    its example constraints are encoded (see SemGusSolver.load_examples).
+    """
+
+    def __init__(self, solution_cache = None, max_solvers = 8):
+        self.solution_cache = solution_cache
+        self.max_solvers = max_solvers
+        self.solvers = OrderedDict()
+
+    def solve(self, problem, options):
+        start = time.perf_counter()
+        response = {"status": "error", "program": None, "size": None, "warm": False}
+        try:
+            if options.get("engine", "smt") != "smt":
+                solver = engine_solver(problem, **options)
+            else:
+                options = {key: value for key, value in options.items() if key != "engine"}
+                key = (problem.grammar_fingerprint(), json.dumps(options, sort_keys=True))
+                solver = self.solvers.pop(key, None)
+                response["warm"] = solver is not None
+                if solver is None:
+                    solver = SemGusSolver(problem=problem, solution_cache=self.solution_cache, **options)
+                solver.load_examples(problem)
+                self.solvers[key] = solver
+                while len(self.solvers) > self.max_solvers:
+                    self.solvers.popitem(last=False)
+
+            result = solver.solve()
+            response.update(result.to_dict(), status=STATUSES.get(result.status, result.status))
+        except Exception as e:
+            response["error"] = "%s: %s" % (type(e).__name__, e)
+        response["time"] = time.perf_counter() - start
+        return response
+
+def _worker(requests, results, solution_cache, max_solvers):
+    # Responses go through the result queue only, and Ctrl-C is left to
+    # the server process, which shuts the workers down
+    sys.stdout = open(os.devnull, 'w')
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    solvers = WarmSolvers(solution_cache, max_solvers)
+    for job_id, problem, options in iter(requests.get, None):
+        results.put((job_id, solvers.solve(problem, options)))
+
+class WorkerPool:
+    """
+    Worker processes that each keep their own warm solvers. Problems are
+    routed by grammar fingerprint, so requests sharing a grammar always
+    reach the worker that already holds its encoding.
+    """
+
+    def __init__(self, workers = 1, solution_cache = None, max_solvers = 8):
+        self.results = multiprocessing.Queue()
+        self.queues = []
+        self.processes = []
+        for _ in range(workers):
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_worker, args=(queue, self.results, solution_cache, max_solvers), daemon=True)
+            process.start()
+            self.queues.append(queue)
+            self.processes.append(process)
+
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+
+    def submit(self, problem, options):
+        """
+        Returns a Future resolving to the response of solving problem.
+        """
+        future = Future()
+        job_id = next(self.ids)
+        with self.lock:
+            self.pending[job_id] = future
+        worker = int(problem.grammar_fingerprint()[:8], 16) % len(self.queues)
+        self.queues[worker].put((job_id, problem, options))
+        return future
+
+    def _collect(self):
+        for job_id, response in iter(self.results.get, None):
+            with self.lock:
+                future = self.pending.pop(job_id)
+            future.set_result(response)
+
+    def close(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+        self.results.put(None)
+        self.collector.join()
+
+class SynthesisServer:
+    """
+    Answers synthesis requests given as JSON objects, one per line. A
+    request names its problem by "sem_file" (converted with semgus-parser,
+    through the conversion cache), "json" (a converted event file) or
+    "events" (the event array itself), and may set solver "options" as
+    accepted by SemGusSolver, plus "engine". Every response carries the
+    request's "id", a status ("solved", "no_solution", "timeout", "unknown"
+    or "error"), the program and its size, the solve time, whether a warm
+    solver was reused and the solve's stats. Budgets are set per request
+    with the "timeout" (seconds) and "max_memory" (megabytes) options.
+    """
+
+    def __init__(self, pool, exe_path, cache = None):
+        self.pool = pool
+        self.exe_path = exe_path
+        self.cache = cache
+
+    def load(self, request):
+        """
+        Parses the problem of a request into its compiled form.
+        """
+        parser = SemGusParser(self.exe_path, request.get("sem_file"), cache=self.cache)
+        if "events" in request:
+            parser.parse_events(request["events"])
+        elif "json" in request:
+            parser.parse_json(request["json"])
+        elif "sem_file" in request:
+            parser.stream_sem()
+        else:
+            raise ValueError("Request names no problem; expected sem_file, json or events")
+        if not parser.synth_fun:
+            raise ValueError("No synth-fun found in the problem")
+        return parser.compile_problem()
+
+    def submit(self, line):
+        """
+        Returns a Future resolving to the response to one request line.
+        """
+        request = {}
+        try:
+            request = json.loads(line)
+            future = self.pool.submit(self.load(request), request.get("options", {}))
+        except Exception as e:
+            future = Future()
+            future.set_result({"status": "error", "error": "%s: %s" % (type(e).__name__, e)})
+
+        response = Future()
+        request_id = request.get("id") if isinstance(request, dict) else None
+        future.add_done_callback(lambda done: response.set_result(dict(done.result(), id=request_id)))
+        return response
+
+    def serve_lines(self, infile, outfile):
+        """
+        Answers the requests read from infile on outfile. Requests are
+        solved concurrently, so responses are written as they complete.
+        """
+        lock = threading.Lock()
+        responses = []
+
+        def write(response):
+            with lock:
+                outfile.write(json.dumps(response.result()) + "\n")
+                outfile.flush()
+
+        for line in infile:
+            if line.strip():
+                response = self.submit(line)
+                response.add_done_callback(write)
+                responses.append(response)
+        for response in responses:
+            response.result()
+
+    def serve_socket(self, path):
+        """
+        Listens on a Unix socket; every connection is a JSON-lines session.
+        """
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server.serve_lines(
+                    (line.decode() for line in self.rfile),
+                    _TextWriter(self.wfile))
+
+        if os.path.exists(path):
+            os.remove(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as unix_server:
+            unix_server.serve_forever()
+
+class _TextWriter:
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode())
+
+    def flush(self):
+        self.wfile.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running SemGus synthesis server")
+    parser.add_argument("--socket", help="Unix socket to listen on instead of reading requests from stdin", default=None)
+    parser.add_argument("--exe_path", help="Path to the semgus-parser.exe file", default="tools/semgus-parser.exe")
+    parser.add_argument("--workers", help="Number of worker processes", type=int, default=1)
+    parser.add_argument("--max_solvers", help="Warm solvers kept per worker", type=int, default=8)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    # Responses are the only output on stdout
+    output = sys.stdout
+    sys.stdout = sys.stderr
+
+    pool = WorkerPool(args.workers, solution_cache(args), args.max_solvers)
+    server = SynthesisServer(pool, args.exe_path, conversion_cache(args))
+    try:
+        if args.socket:
+            print("Listening on %s" % args.socket)
+            server.serve_socket(args.socket)
+        else:
+            server.serve_lines(sys.stdin, output)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+
+if __name__ == "__main__":
+    main()
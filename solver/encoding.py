@@ -0,0 +1,194 @@
+from itertools import count
+from z3 import *
+
+# Distinguishes the enumeration sorts of different EnumEncoding instances
+_enum_ids = count()
+
+class IntEncoding:
+    """
+    Encodes line, nonterminal and production indices as integers whose
+    ranges are bounded by explicit constraints.
+
+    By default n_l, p_l, c and v_e_l are uninterpreted functions over line
+    indices. With constants=True every (line), (line, child) and
+    (example, line) application is a separate constant instead, and a child
+    pointer selects the line it refers to with an ite over the earlier lines.
+    """
+
+    def __init__(self, N, P, K, max_size, constants = False):
+        self.N = N
+        self.P = P
+        self.K = K
+        self.max_size = max_size
+        self.constants = constants
+        self._declare_sorts()
+
+        if not constants:
+            # Uninterpreted function: n_l maps statement lines to nonterminal identifiers
+            self.n_l = Function('n_l', self.line_sort, self.nt_sort)
+
+            # Uninterpreted function: p_l maps statement lines to production identifiers
+            self.p_l = Function('p_l', self.line_sort, self.prod_sort)
+
+            # Uninterpreted function: c maps line l and child ID k to corresponding line
+            self.c_l = Function('c', self.line_sort, IntSort(), self.line_sort)
+
+            # Uninterpreted function: v_e_l maps example and line l to its value
+            self.v_e_l = Function('v_e_l', IntSort(), self.line_sort, IntSort())
+
+    def _declare_sorts(self):
+        self.line_sort = IntSort()
+        self.nt_sort = IntSort()
+        self.prod_sort = IntSort()
+
+    def line(self, j):
+        """
+        Returns line index j as a term of the line sort.
+        """
+        return j if is_expr(j) else IntVal(j)
+
+    def nt(self, i):
+        return IntVal(i)
+
+    def prod(self, i):
+        return IntVal(i)
+
+    def lt(self, a, b):
+        return a < self.line(b)
+
+    def le(self, a, b):
+        return a <= self.line(b)
+
+    def _bounded(self, x, n):
+        return And(x >= 0, x < n)
+
+    def n(self, l):
+        if self.constants:
+            return Const('n_%d' % l, self.nt_sort)
+        return self.n_l(self.line(l))
+
+    def p(self, l):
+        if self.constants:
+            return Const('p_%d' % l, self.prod_sort)
+        return self.p_l(self.line(l))
+
+    def c(self, l, k):
+        if self.constants:
+            return Const('c_%d_%d' % (l, k), self.line_sort)
+        return self.c_l(self.line(l), k)
+
+    def v(self, e, l):
+        if self.constants:
+            return Int('v_%d_%d' % (e, l))
+        return self.v_e_l(e, self.line(l))
+
+    def child(self, l, k, term):
+        """
+        Returns term applied to the line that child k of line l points to.
+        """
+        pointer = self.c(l, k)
+        if not self.constants:
+            return term(pointer)
+        result = term(max(l - 1, 0))
+        for j in reversed(range(l - 1)):
+            result = If(pointer == self.line(j), term(j), result)
+        return result
+
+    def domain(self, l):
+        """
+        Returns the range constraints of the indices stored on line l.
+        """
+        constraints = [
+            self._bounded(self.n(l), self.N),
+            self._bounded(self.p(l), self.P),
+        ]
+
+        # Children always live on an earlier line, so pointers of line 0
+        # (which has no children) are pinned to 0
+        for k in range(self.K):
+            constraints.append(self._bounded(self.c(l, k), max(l, 1)))
+        return [x for x in constraints if not is_true(x)]
+
+    def index(self, model, term):
+        """
+        Returns the index a nonterminal, production or line term has in model.
+        """
+        return model.eval(term, model_completion=True).as_long()
+
+class BitVecEncoding(IntEncoding):
+    """
+    Encodes line, nonterminal and production indices as bit-vectors just
+    wide enough for max_size lines, N nonterminals and P productions.
+    """
+
+    def _declare_sorts(self):
+        self.line_bits = _bits(self.max_size)
+        self.nt_bits = _bits(self.N)
+        self.prod_bits = _bits(self.P)
+        self.line_sort = BitVecSort(self.line_bits)
+        self.nt_sort = BitVecSort(self.nt_bits)
+        self.prod_sort = BitVecSort(self.prod_bits)
+
+    def line(self, j):
+        return j if is_expr(j) else BitVecVal(j, self.line_bits)
+
+    def nt(self, i):
+        return BitVecVal(i, self.nt_bits)
+
+    def prod(self, i):
+        return BitVecVal(i, self.prod_bits)
+
+    def lt(self, a, b):
+        return ULT(a, self.line(b))
+
+    def le(self, a, b):
+        return ULE(a, self.line(b))
+
+    def _bounded(self, x, n):
+        # Every value of a sort with exactly n values is in range
+        if n >= 2 ** x.size():
+            return BoolVal(True)
+        return ULT(x, BitVecVal(n, x.size()))
+
+class EnumEncoding(BitVecEncoding):
+    """
+    Encodes nonterminal and production indices as Z3 enumeration sorts,
+    whose values need no range constraints. Lines keep the bit-vector
+    encoding since child pointers are ordered.
+    """
+
+    def _declare_sorts(self):
+        BitVecEncoding._declare_sorts(self)
+        sort_id = next(_enum_ids)
+        self.nt_sort, self.nt_values = EnumSort(
+            'NT_%d' % sort_id, ['nt_%d_%d' % (sort_id, i) for i in range(self.N)])
+        self.prod_sort, self.prod_values = EnumSort(
+            'Prod_%d' % sort_id, ['prod_%d_%d' % (sort_id, i) for i in range(self.P)])
+
+    def nt(self, i):
+        return self.nt_values[i]
+
+    def prod(self, i):
+        return self.prod_values[i]
+
+    def _bounded(self, x, n):
+        if x.sort() == self.line_sort:
+            return BitVecEncoding._bounded(self, x, n)
+        return BoolVal(True)
+
+    def index(self, model, term):
+        value = model.eval(term, model_completion=True)
+        if term.sort() == self.nt_sort:
+            return [v.eq(value) for v in self.nt_values].index(True)
+        if term.sort() == self.prod_sort:
+            return [v.eq(value) for v in self.prod_values].index(True)
+        return value.as_long()
+
+def _bits(n):
+    return max(1, (n - 1).bit_length())
+
+ENCODINGS = {
+    "int": IntEncoding,
+    "bv": BitVecEncoding,
+    "enum": EnumEncoding,
+}
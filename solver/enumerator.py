@@ -0,0 +1,231 @@
+import itertools
+import time
+import numpy as np
+from z3 import unknown
+from solver.interpreter import EVALUATORS
+from solver.profiler import Profiler
+from solver.result import Interrupted, SynthesisResult
+
+class EnumerativeSolver:
+    """
+    Bottom-up enumerative synthesis over a compiled Problem. Terms are built
+    by increasing tree size and evaluated on every example at once as NumPy
+    columns; of all terms of a nonterminal that compute the same column
+    only the first (smallest) one is kept, unless a later one needs fewer
+    distinct lines. Like the SMT encoding, terms with
+    a negative value on some example and programs of more than max_size
+    distinct lines are not considered.
+
+    The pruning is not complete under the line bound: a dropped term with
+    more lines may share them with its siblings, so a program the kept
+    terms cannot build may still exist. An exhausted search is therefore
+    reported as unknown, never as unsat.
+    """
+
+    def __init__(self, problem, max_size = 4, timeout = None, profiler = None):
+        self.problem = problem
+        self.max_size = max_size
+        self.profiler = profiler or Profiler()
+
+        # Wall-clock budget of each solve in seconds, see SemGusSolver
+        self.timeout = timeout
+        self.deadline = None
+
+        # Set by cancel() to stop the running solve
+        self.cancelled = False
+
+        # Number of distinct lines used by the last program found
+        self.size = None
+
+        # Lines of the last program found, see SemGusSolver.program_lines
+        self.lines = None
+
+        # A program of max_size lines and arity K is a tree of at most
+        # 1 + K + ... + K^(max_size-1) nodes
+        K = max(problem.max_arity, 1)
+        self.max_tree_size = sum(K ** i for i in range(max_size))
+
+    def _reset(self):
+        num_nts = len(self.problem.nonterminals)
+
+        # Every kept term: (production, child term ids, values, line set)
+        self.terms = []
+
+        # Term ids by nonterminal and tree size
+        self.bank = [{} for _ in range(num_nts)]
+
+        # Fewest lines of a kept term per nonterminal and value column (as bytes)
+        self.seen = [{} for _ in range(num_nts)]
+
+    def _add(self, nt, size, prod, child_ids, values, lines):
+        """
+        Keeps a new term unless an equivalent one exists or it is out of
+        bounds. Returns its id, or None.
+        """
+        if values.size and values.min() < 0:
+            return None
+        term = len(self.terms)
+        lines = lines | {term}
+        key = values.tobytes()
+        if len(lines) > self.max_size or self.seen[nt].get(key, self.max_size + 1) <= len(lines):
+            return None
+        self.seen[nt][key] = len(lines)
+        self.terms.append((prod, child_ids, values, lines))
+        self.bank[nt].setdefault(size, []).append(term)
+        return term
+
+    def _check_budget(self):
+        if self.cancelled:
+            raise Interrupted(unknown, "canceled")
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise Interrupted(unknown, "timeout")
+
+    def cancel(self):
+        """
+        Stops the running solve; safe to call from another thread. A
+        cancel() issued before solve() starts stops that solve at once.
+        """
+        self.cancelled = True
+
+    def _is_solution(self, nt, term):
+        return nt == self.problem.start and np.array_equal(self.terms[term][2], self.problem.outputs)
+
+    def _child_choices(self, children, budget):
+        """
+        Yields, for every way of splitting budget nodes among the children,
+        the lists of term ids of each child's nonterminal and size.
+        """
+        if not children:
+            if budget == 0:
+                yield []
+            return
+        nt, rest = children[0], children[1:]
+        for size, terms in list(self.bank[nt].items()):
+            # Every remaining child needs at least one node
+            if size + len(rest) <= budget:
+                for tail in self._child_choices(rest, budget - size):
+                    yield [terms] + tail
+
+    def _grow(self, prod, size):
+        """
+        Builds the terms of production prod with the given tree size. The
+        last child is enumerated in a single vectorized evaluation, the
+        others term by term. Returns the id of a solution, or None.
+        """
+        problem = self.problem
+        _, operator, operands = problem.templates[prod]
+        nt = problem.prod_nt[prod]
+        children = problem.children[prod]
+
+        for choices in self._child_choices(children, size - 1):
+            last = choices[-1]
+            column = np.stack([self.terms[t][2] for t in last])
+            for prefix in itertools.product(*choices[:-1]):
+                self._check_budget()
+                prefix = list(prefix)
+                values = [self.terms[t][2] for t in prefix] + [column]
+                results = np.broadcast_to(EVALUATORS[operator](*[values[k] for k in operands]),
+                                          (len(last), problem.num_examples))
+                self.profiler.count("terms", len(last))
+                lines = frozenset().union(*[self.terms[t][3] for t in prefix])
+                for i, t in enumerate(last):
+                    term = self._add(nt, size, prod, prefix + [t], np.ascontiguousarray(results[i]),
+                                     lines | self.terms[t][3])
+                    if term is not None and self._is_solution(nt, term):
+                        return term
+        return None
+
+    def enumerate(self):
+        """
+        Enumerates terms by tree size until one of the start nonterminal
+        produces the expected outputs. Returns its term id, or None.
+        """
+        problem = self.problem
+        self._reset()
+
+        for size in range(1, self.max_tree_size + 1):
+            self._check_budget()
+            for prod, template in enumerate(problem.templates):
+                if template is None:
+                    continue
+                _, operator, operands = template
+                arity = len(problem.children[prod])
+                if arity == 0:
+                    if size > 1:
+                        continue
+                    if operator == "var":
+                        values = problem.inputs[operands]
+                    else:
+                        values = np.full(problem.num_examples, operands, dtype=np.int64)
+                    self.profiler.count("terms")
+                    term = self._add(problem.prod_nt[prod], size, prod, [], values, frozenset())
+                    if term is not None and self._is_solution(problem.prod_nt[prod], term):
+                        return term
+                elif size > arity:
+                    term = self._grow(prod, size)
+                    if term is not None:
+                        return term
+        return None
+
+    def program_lines(self, term):
+        """
+        Returns the lines of a term as a dict mapping each line to its
+        production index and the lines of its children, children first.
+        """
+        lines = {}
+        index = {}
+
+        def visit(t):
+            if t not in index:
+                prod, child_ids, _, _ = self.terms[t]
+                child_lines = [visit(c) for c in child_ids]
+                index[t] = len(lines)
+                lines[index[t]] = (prod, child_lines)
+            return index[t]
+
+        visit(term)
+        return lines
+
+    def build_program(self, term):
+        """
+        Returns the program of a term in the format of SemGusSolver.build_program.
+        """
+        prod, child_ids, _, _ = self.terms[term]
+        name = self.problem.productions[prod]
+        if len(child_ids) == 0:
+            return " " + str(name[1:]) + " "
+        program = str(name[1:]) + " ( "
+        for child in child_ids:
+            program += self.build_program(child)
+        program += " ) "
+        return program
+
+    def solve(self):
+        """
+        Solves the problem within the time budget and returns a
+        SynthesisResult, see SemGusSolver.solve.
+        """
+        start = time.perf_counter()
+        self.deadline = start + self.timeout if self.timeout is not None else None
+        try:
+            with self.profiler.phase("enumerate"):
+                term = self.enumerate()
+        except Interrupted as e:
+            return SynthesisResult.from_check(e.result, e.reason, time=time.perf_counter() - start, stats=self._stats())
+        finally:
+            # A cancel() applies to a single solve
+            self.cancelled = False
+
+        if term is None:
+            return SynthesisResult("unknown", reason="search exhausted", time=time.perf_counter() - start, stats=self._stats())
+        self.lines = self.program_lines(term)
+        self.size = len(self.lines)
+        return SynthesisResult("sat", self.build_program(term), self.size,
+                               time=time.perf_counter() - start, stats=self._stats())
+
+    def _stats(self):
+        return {
+            "times": dict(self.profiler.times),
+            "counts": dict(self.profiler.counts),
+            "terms_kept": len(self.terms),
+        }
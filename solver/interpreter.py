@@ -0,0 +1,85 @@
+import numpy as np
+
+def _div(a, b):
+    # SMT-LIB integer division rounds towards negative infinity for a
+    # positive divisor and towards positive infinity for a negative one;
+    # division by zero yields 0, as the encoding guards it
+    a, b = np.asarray(a), np.asarray(b)
+    safe = np.where(b == 0, 1, b)
+    return np.where(b == 0, 0, np.where(b > 0, a // safe, -(a // -safe)))
+
+# Concrete semantics of each operator. Booleans are represented as the
+# integers 1 (true) and 0 (false), as in the Z3 encoding. Every operator
+# works elementwise, so a program runs on a whole column of examples at once.
+EVALUATORS = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": _div,
+    "<": lambda a, b: np.where(np.less(a, b), 1, 0),
+    ">": lambda a, b: np.where(np.greater(a, b), 1, 0),
+    "==": lambda a, b: np.where(np.equal(a, b), 1, 0),
+    "not": lambda a: np.where(np.not_equal(a, 1), 1, 0),
+    "and": lambda a, b: np.where(np.equal(a, 1) & np.equal(b, 1), 1, 0),
+    "ite": lambda a, b, c: np.where(np.equal(a, 1), b, c),
+}
+
+class Interpreter:
+    """
+    Runs synthesized programs directly in Python. A program is given by its
+    lines, a dict mapping each line to its production index and the lines
+    of its children (see SemGusSolver.program_lines), and is evaluated from
+    a root line using the semantic templates of a compiled Problem.
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.templates = problem.templates
+
+    def evaluate(self, lines, root, inputs):
+        """
+        Returns the value of line root, given a dict from input variable to
+        value. With NumPy columns as inputs every example is evaluated at
+        once and the result is a column as well.
+        """
+        values = {}
+
+        def run(l):
+            if l not in values:
+                prod, child_lines = lines[l]
+                if self.templates[prod] is None:
+                    raise ValueError("No semantics for production %s" % self.problem.productions[prod])
+                _, operator, operands = self.templates[prod]
+                if operator == "var":
+                    values[l] = inputs[operands]
+                elif operator == "const":
+                    values[l] = operands
+                else:
+                    values[l] = EVALUATORS[operator](*[run(child_lines[k]) for k in operands])
+            return values[l]
+
+        return run(root)
+
+    def run(self, lines, root):
+        """
+        Returns the outputs of the program on every example of the problem.
+        """
+        values = self.evaluate(lines, root, self.problem.inputs)
+        return np.broadcast_to(values, (self.problem.num_examples,))
+
+    def counterexample(self, lines, root, skip=()):
+        """
+        Returns the index of the first example, not in skip, on which the
+        program does not produce the expected output, or None.
+        """
+        skip = set(skip)
+        for e in np.flatnonzero(self.run(lines, root) != self.problem.outputs):
+            if int(e) not in skip:
+                return int(e)
+        return None
+
+    def validate(self, lines, root):
+        """
+        Checks the program against every example.
+        """
+        return self.counterexample(lines, root) is None
@@ -0,0 +1,89 @@
+import io
+import multiprocessing
+from contextlib import redirect_stdout
+from solver.result import SynthesisResult
+from solver.solver import SemGusSolver
+from solver.enumerator import EnumerativeSolver
+
+def default_configs(max_size, seeds = (0, 1), cegis = False, timeout = None, max_memory = None):
+    """
+    Returns a portfolio of solver configurations differing in program size,
+    encoding backend, random seed and tactic. Every configuration gets the
+    time budget, and every Z3 one the memory budget.
+    """
+    configs = []
+
+    # Iterative deepening over every backend and seed
+    for encoding in ("int", "bv", "enum"):
+        for seed in seeds:
+            configs.append({"max_size": max_size, "incremental": True, "encoding": encoding,
+                            "constants": True, "symmetry_breaking": True, "seed": seed})
+
+    # Fixed sizes, so that a large program does not wait for the smaller sizes
+    for L in range(2, max_size + 1):
+        configs.append({"max_size": L, "encoding": "bv", "constants": True, "symmetry_breaking": True})
+
+    # Semantics asserted only for the productions models actually use
+    configs.append({"max_size": max_size, "incremental": True, "encoding": "bv", "constants": True,
+                    "symmetry_breaking": True, "lazy": True})
+
+    # The integer encoding with constants is pure linear integer arithmetic
+    configs.append({"max_size": max_size, "incremental": True, "constants": True, "tactic": "qflia"})
+
+    for config in configs:
+        config.update(cegis=cegis, timeout=timeout, max_memory=max_memory)
+
+    # Bottom-up enumeration, often fastest on small grammars
+    configs.append({"engine": "enum", "max_size": max_size, "timeout": timeout})
+    return configs
+
+def engine_solver(problem, engine = "smt", **options):
+    """
+    Returns the solver of the given engine: "smt" for SemGusSolver, "enum"
+    for EnumerativeSolver.
+    """
+    if engine == "enum":
+        return EnumerativeSolver(problem, **options)
+    return SemGusSolver(problem=problem, **options)
+
+def _solve(job):
+    problem, config = job
+    # Workers report through their return value only, and a configuration
+    # that fails loses the race instead of ending it
+    try:
+        with redirect_stdout(io.StringIO()):
+            result = engine_solver(problem, **config).solve()
+    except Exception as e:
+        return config, None, "%s: %s" % (type(e).__name__, e)
+    return config, result, None
+
+def solve_portfolio(problem, configs, processes = None):
+    """
+    Solves the compiled problem once per configuration in a process pool.
+    The first configuration to find a program wins and the remaining
+    workers are terminated. Returns the winning SynthesisResult and
+    configuration. If no configuration finds a program, returns the unsat
+    result of a configuration that covers the largest max_size if there is
+    one, else a timeout or unknown result, with its configuration.
+    Configurations that raise are reported and otherwise ignored.
+    """
+    max_size = max(config["max_size"] for config in configs)
+    outcomes = {}
+    pool = multiprocessing.Pool(processes)
+    try:
+        for config, result, error in pool.imap_unordered(_solve, [(problem, config) for config in configs]):
+            if error is not None:
+                print("Configuration %s failed: %s" % (config, error))
+            elif result.status == "sat":
+                return result, config
+            elif result.status != "unsat" or config["max_size"] == max_size:
+                # An unsat of a smaller max_size leaves the larger programs open
+                outcomes.setdefault(result.status, (result, config))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    for status in ("unsat", "timeout", "unknown"):
+        if status in outcomes:
+            return outcomes[status]
+    return SynthesisResult("unknown", reason="every configuration failed"), None
@@ -0,0 +1,101 @@
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+
+class Profiler:
+    """
+    Collects the wall-clock time of each phase, event counters (asserted
+    constraints, op() calls, ...) and the Z3 statistics of every check.
+    With cprofile set, the phases entered with profile=True additionally
+    run under cProfile.
+
+    The report is a JSON object whose traceEvents list uses the Chrome trace
+    event format, so a written report can be opened in chrome://tracing or
+    Perfetto as it is.
+    """
+
+    def __init__(self, cprofile = False):
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self._profiling = False
+        self.reset()
+
+    def reset(self):
+        """
+        Drops everything recorded so far, e.g. between the requests a warm
+        solver answers.
+        """
+        self.start = time.perf_counter()
+        self.times = {}
+        self.counts = {}
+        self.checks = []
+        self.events = []
+
+    @contextmanager
+    def phase(self, name, profile = False):
+        """
+        Times the enclosed block as one occurrence of phase name.
+        """
+        enable = profile and self.cprofile is not None and not self._profiling
+        if enable:
+            self._profiling = True
+            self.cprofile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            if enable:
+                self.cprofile.disable()
+                self._profiling = False
+            self.times[name] = self.times.get(name, 0.0) + end - start
+            self.events.append({"name": name, "ph": "X", "pid": 0, "tid": 0,
+                                "ts": (start - self.start) * 1e6, "dur": (end - start) * 1e6})
+
+    def count(self, name, n = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def add(self, stats):
+        """
+        Adds the phase times and counters of a SynthesisResult's stats, e.g.
+        of a solve that ran in another process.
+        """
+        for name, duration in stats.get("times", {}).items():
+            self.times[name] = self.times.get(name, 0.0) + duration
+        for name, n in stats.get("counts", {}).items():
+            self.count(name, n)
+
+    def record_check(self, solver, size, result, duration):
+        """
+        Records the outcome of one Solver.check() together with the solver's
+        statistics (conflicts, decisions, memory, ...) at that point.
+        """
+        statistics = solver.statistics()
+        self.checks.append({
+            "size": size,
+            "result": str(result),
+            "time": duration,
+            "statistics": {key: statistics.get_key_value(key) for key in statistics.keys()},
+        })
+
+    def report(self):
+        return {
+            "times": self.times,
+            "counts": self.counts,
+            "checks": self.checks,
+            "traceEvents": self.events,
+        }
+
+    def write(self, path):
+        """
+        Writes the report to path and, if cProfile ran, its statistics next
+        to it with the extension .prof (see python -m pstats).
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(os.path.splitext(path)[0] + ".prof")
@@ -0,0 +1,64 @@
+from z3 import sat, unsat
+
+class SynthesisResult:
+    """
+    Outcome of one solve. status is "sat" (program holds a program of size
+    lines), "unsat" (no program of at most max_size lines exists), "timeout"
+    (the time budget ran out) or "unknown" (Z3 gave up, ran out of memory
+    or the solve was canceled; see reason). stats holds the phase times and
+    counters so far and the Z3 statistics of the last check, so a
+    timed-out solve still reports how far it got. A result of
+    SemGusSolver.solutions also lists every program found in solutions,
+    the first of which is program.
+    """
+
+    __slots__ = ("status", "program", "size", "cost", "reason", "time", "stats", "solutions")
+
+    def __init__(self, status, program = None, size = None, cost = None, reason = None, time = 0.0, stats = None, solutions = None):
+        self.status = status
+        self.program = program
+        self.size = size
+        self.cost = cost
+        self.reason = reason
+        self.time = time
+        self.stats = stats or {}
+        self.solutions = solutions
+
+    @classmethod
+    def from_check(cls, result, reason = None, **fields):
+        """
+        Returns the result for a Z3 CheckSatResult that ended the search.
+        """
+        if result == sat:
+            return cls("sat", **fields)
+        if result == unsat:
+            return cls("unsat", **fields)
+        return cls("timeout" if reason == "timeout" else "unknown", reason=reason, **fields)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def describe(self):
+        """
+        Returns the result as printed on the command line.
+        """
+        if self.status == "sat":
+            if self.cost is not None:
+                return "Solution found (size %d, cost %s):\n%s" % (self.size, self.cost, self.program)
+            return "Solution found (size %d):\n%s" % (self.size, self.program)
+        if self.status == "unsat":
+            return "No Solution"
+        if self.status == "timeout":
+            return "Timeout after %.3fs" % self.time
+        return "Unknown (%s)" % self.reason
+
+class Interrupted(Exception):
+    """
+    Raised inside a solve when a check ends without sat or unsat: the time
+    or memory budget ran out, Z3 gave up or the solve was canceled.
+    """
+
+    def __init__(self, result, reason):
+        super().__init__(reason)
+        self.result = result
+        self.reason = reason
@@ -0,0 +1,81 @@
+import json
+import os
+from grammar.cache_files import atomic_writer, evict
+
+class SolutionCache:
+    """
+    On-disk store of synthesized programs. Entries are grouped by the
+    grammar fingerprint of the problem and keyed on its examples
+    fingerprint, hold the program as lines of production names together
+    with the examples it was synthesized for, and are evicted least
+    recently used first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, grammar_key, examples_key):
+        return os.path.join(self.directory, grammar_key, examples_key + ".json")
+
+    def candidates(self, problem):
+        """
+        Yields (lines, program) for the cached programs of problem's grammar
+        that were synthesized for the same examples or a subset of them: an
+        exact match first, then the others most recently used first. Lines
+        map each line to its production index in problem and its child lines.
+        """
+        grammar_key = problem.grammar_fingerprint()
+        directory = os.path.join(self.directory, grammar_key)
+        if not os.path.isdir(directory):
+            return
+
+        exact = problem.examples_fingerprint() + ".json"
+        names = []
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                try:
+                    names.append((name == exact, os.stat(os.path.join(directory, name)).st_mtime, name))
+                except FileNotFoundError:
+                    continue
+
+        rows = None
+        for is_exact, _, name in sorted(names, reverse=True):
+            path = os.path.join(directory, name)
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if not is_exact:
+                rows = rows if rows is not None else problem.example_rows()
+                if not all(tuple(row) in rows for row in entry["examples"]):
+                    continue
+
+            lines = {}
+            for line, prod, child_lines in entry["lines"]:
+                if prod not in problem.prod_index:
+                    break
+                lines[line] = (problem.prod_index[prod], child_lines)
+            else:
+                try:
+                    # Marks the entry as recently used
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+                yield lines, entry["program"]
+
+    def put(self, problem, lines, program):
+        """
+        Stores the program with the given lines (see SemGusSolver.program_lines)
+        as the solution of problem and evicts old entries.
+        """
+        entry = {
+            "program": program,
+            "lines": [[line, problem.productions[prod], list(child_lines)]
+                      for line, (prod, child_lines) in sorted(lines.items())],
+            "examples": sorted(problem.example_rows()),
+        }
+        with atomic_writer(self._path(problem.grammar_fingerprint(), problem.examples_fingerprint())) as f:
+            json.dump(entry, f)
+        evict(self.directory, self.max_bytes)
@@ -1,304 +1,906 @@
 import os
+import time
+from contextlib import contextmanager
 from z3 import *
+from solver.interpreter import Interpreter
+from solver.encoding import ENCODINGS
+from grammar.problem import Problem
+from solver.profiler import Profiler
+from solver.result import Interrupted, SynthesisResult
+
+# Constraints relating a line's value v to its operand values. Booleans are
+# encoded as the integers 1 (true) and 0 (false); division by zero yields 0,
+# as in the interpreter.
+OPERATORS = {
+    "+": lambda v, a, b: v == a + b,
+    "-": lambda v, a, b: v == a - b,
+    "*": lambda v, a, b: v == a * b,
+    "/": lambda v, a, b: v == If(b == 0, 0, a / b),
+    "<": lambda v, a, b: If(a < b, v == 1, v == 0),
+    ">": lambda v, a, b: If(a > b, v == 1, v == 0),
+    "==": lambda v, a, b: If(a == b, v == 1, v == 0),
+    "not": lambda v, a: If(Not(a == 1), v == 1, v == 0),
+    "and": lambda v, a, b: If(And(a == 1, b == 1), v == 1, v == 0),
+    "ite": lambda v, a, b, c: If(a == 1, v == b, v == c),
+}
+
+# Operators whose two operands can be swapped without changing the value
+COMMUTATIVE = {"+", "*", "==", "and"}
 
 class SemGusSolver:
-    def __init__(self, grammar, semantics, specification, functions, synth_fun, max_size = 4):
-        self.grammar = grammar
-        self.semantics = semantics
-        self.specification = specification
+    def __init__(self, grammar = None, semantics = None, specification = None, functions = None, synth_fun = None, max_size = 4, incremental = False, cegis = False, encoding = "int", constants = False, symmetry_breaking = False, lazy = False, optimize = None, costs = None, seed = None, tactic = None, timeout = None, max_memory = None, problem = None, profiler = None, solution_cache = None):
+        # The compiled problem, built from the parsed dicts unless given
+        self.problem = problem or Problem(grammar, semantics, specification, functions, synth_fun)
         self.max_size = max_size
-        self.functions = functions
-        self.synth_fun = synth_fun
-        self.solver = Solver()
+        self.incremental = incremental
+        self.cegis = cegis
+        self.encoding_name = encoding
+        self.constants = constants
+        self.symmetry_breaking = symmetry_breaking
+        self.lazy = lazy
+        # Objective minimized by optimal_encoding: "size" (used lines) or
+        # "cost" (summed production costs, see program_cost), if any
+        self.optimize = optimize
+        self.costs = costs or {}
+        if optimize:
+            self.solver = Optimize()
+        else:
+            self.solver = Tactic(tactic).solver() if tactic else Solver()
+        if seed is not None:
+            self.solver.set("random_seed", seed)
 
-    def linear_encoding(self):
+        # Wall-clock budget of each solve in seconds, passed on to every
+        # check as the time left
+        self.timeout = timeout
+        self.deadline = None
+
+        # Memory budget in megabytes. Optimize has no per-solver limit, so
+        # it falls back to Z3's process-wide one while it solves, see
+        # _memory_budget
+        self.max_memory = max_memory
+        if max_memory is not None and not optimize:
+            self.solver.set("max_memory", max_memory)
+
+        # Set by cancel() to stop the running solve
+        self.cancelled = False
+
+        # Number of lines whose constraints are currently asserted
+        self.encoded_lines = 0
+
+        # Indices of the examples whose constraints are currently asserted
+        self.active_examples = []
+
+        # Maps each program size to the literal that guards its root constraints
+        self.roots = {}
+
+        # Program sizes whose objective optimal_encoding has asserted
+        self.objectives = set()
+
+        # Number of distinct lines used by the last program found
+        self.size = None
+
+        # Lines of the last program found, see program_lines
+        self.lines = None
+
+        # Store of earlier solutions tried before any SMT work, if any
+        self.solution_cache = solution_cache
+
+        # Example the counterexample-guided search starts from
+        self.initial_example = 0
+
+        # (example, line, production) triples whose behavioral constraint
+        # the lazy encoding has asserted
+        self.refined = set()
+
+        # Whether the example-dependent constraints live in a solver scope,
+        # see load_examples
+        self.scoped = False
+
+        # Phase times, counters and Z3 statistics of this solver
+        self.profiler = profiler or Profiler()
+
+        with self.profiler.phase("setup"):
+            self._build_tables()
+
+    def _build_tables(self):
         """
-        Encodes the problem into a linear format using Z3.
+        Takes the size-independent data structures used by the encoding from
+        the compiled problem. Nonterminals and productions are referred to
+        by their indices throughout.
         """
-
-        # Max size of program
-        L = self.max_size
+        problem = self.problem
 
         # Max arity of Program
-        K = 0
+        self.K = problem.max_arity
 
-        # Max number of nonterminals
-        N = 0
+        # Number of nonterminals
+        self.N = len(problem.nonterminals)
 
-        # Max number of productions
+        # Number of productions
+        self.P = len(problem.productions)
 
-        # Maps each nonterminal to an index
-        nts = {}
+        # Semantic template of each production index
+        # (output symbol, operator, operands), see compile_semantics
+        self.templates = problem.templates
 
-        # Maps each nonterminal production to an index and
-        # seperates them by dicts by nonterminal
-        nt_prods = []
-        
-        # Single dict maps prods to indices
-        production_mappings = {}
+        self.interpreter = Interpreter(problem)
 
-        # Tracks nonterminals of children of each production
-        children = {}
+        # Terms for n_l, p_l, c and v_e_l over the sorts of the chosen backend
+        self.encoding = ENCODINGS[self.encoding_name](self.N, self.P, self.K, self.max_size, self.constants)
 
-        # Number of productions
-        num_prods = 0
-
-        # Tracks variables of each nonterminal and their types 
-        funcs = self.functions
-
-        # Specifies the input, output, and term variables of each nonterminal
-        symbols = {}
-
-        # Tracks each constraint type and variables involved for each chc
-        chcs = {}
-
-        # Behovioral specification with input/output examples
-        examples = []
-
-        # Mapppings of each variable to their example
-        ex_vars = []
-
-        # Fill various data structures
-        for nonterminal, production in self.grammar.items():
-            nts[nonterminal] = N
-            N += 1
-            prods = {}
-            for i in production['constructors']:
-                prods[i['name']] = num_prods
-                children[i['name']] = i['children']
-                if K < len(i['children']):
-                    K = len(i['children'])
-                num_prods += 1
-            nt_prods.append(prods)
-
-        for n in nt_prods:
-            for key, value in n.items():
-                production_mappings[key] = value
-
-        for id, chc in self.semantics.items():
-            start = id.find('-') + 1
-            end = id.find('-',start)
-            chc_id = id[start:end]
-            name = chc["head"]["name"]
-            symbols[name] = {}
-            symbols[name]["inputs"] = []
-            symbols[name]["outputs"] = []
-            for i in chc["symbols"]["inputs"]:
-                symbols[name]["inputs"].append(i["id"])
-            for i in chc["symbols"]["outputs"]:
-                symbols[name]["outputs"].append(i["id"])
-            symbols[name]["term"] = chc["symbols"]["term"]["id"]
-            args = []
-
-            for i in chc["constraint"]["arguments"]:
-                if isinstance(i,dict):
-                    if ("$" + i["name"]) in children:
-                        if len(children[("$"+i["name"])]) > 0:
-                            sub_args = []
-                            for j in i["arguments"]:
-                                if isinstance(j,dict):
-                                    sub_args.append(j["name"])
-                                else: sub_args.append(j)
-                            args.append((i["name"], sub_args))
-                        else:
-                            args.append(i["name"])
-                    else:
-                        args.append(i["name"])
-                else:
-                    args.append(i)
-            if chc_id in chcs:
-                body_rels = {}
-                for i in chc["bodyRelations"]:
-                    body_rels[i["arguments"][0]] = i["signature"][0]
-                args.append((body_rels,chc["constructor"]["arguments"]))
-                chcs[chc_id]=("ite",args)
+        # S is the starting nonterminal
+        self.S = problem.start
+
+        self._analyze_grammar()
+
+    def _analyze_grammar(self):
+        """
+        Computes the nonterminals reachable from the start symbol and, for
+        every production, the lowest line it can occupy. A term of
+        nonterminal X needs at least depth(X) lines, so a production can only
+        sit above the deepest of its children's minimal terms.
+        """
+        problem = self.problem
+        self.reachable_nts = {self.S}
+        pending = [self.S]
+        while pending:
+            nt = pending.pop()
+            for prod in problem.nt_prods[nt]:
+                for ch in problem.children[prod]:
+                    if ch not in self.reachable_nts:
+                        self.reachable_nts.add(ch)
+                        pending.append(ch)
+
+        depth = {}
+        changed = True
+        while changed:
+            changed = False
+            for nt in range(self.N):
+                for prod in problem.nt_prods[nt]:
+                    child = problem.children[prod]
+                    if all(ch in depth for ch in child):
+                        d = 1 + max([depth[ch] for ch in child], default=0)
+                        if d < depth.get(nt, d + 1):
+                            depth[nt] = d
+                            changed = True
+
+        # Productions with a child that derives no finite term never fit
+        self.min_line = []
+        for child in problem.children:
+            if all(ch in depth for ch in child):
+                self.min_line.append(max([depth[ch] for ch in child], default=0))
             else:
-                chcs[chc_id]=(chc["constraint"]["name"],args)
-
-        for i in self.specification:
-            args = []
-            for j in i["arguments"]:
-                if isinstance(j,dict):
-                    args.append(j["name"])
-                else:
-                    args.append(j)
-            examples.append((i["name"],args))
-
-        for i in examples:
-            var_mappings = {}
-            var = 0 
-            for vars, _ in funcs[i[0]].items():
-                var_mappings[vars] = i[1][var]
-                var += 1
-            ex_vars.append(var_mappings)
-
-        P = len(production_mappings)
-        
-        # Uninterpreted function: n_l maps statement lines to nonterminal identifiers
-        # Domain: [0..D-1], Range: [0..N-1]
-        n_l = Function('n_l', IntSort(), IntSort())
-
-        # Uninterpreted function: p_l maps statement lines to production identifiers
-        # Domain: [0..L-1], Range: [0..<number of productions>-1] (use the production count as needed)
-        p_l = Function('p_l', IntSort(), IntSort())
-
-        # Uninterpreted function: c maps line l and child ID k to corresponding line
-        # Domain: [0..L-1] x [0..K-1], Range: [0..L-1]
-        c = Function('c', IntSort(), IntSort(), IntSort())
-
-        # Uninterpreted function: v_e_l maps example and line l to a value in the domain of V_al
-        # Domain: [0..E-1] x [0..L-1], Range: appropriate domain for values (here using Int as an example)
-        v_e_l = Function('v_e_l', IntSort(), IntSort(), IntSort())
+                self.min_line.append(float("inf"))
 
-        # S is the starting nonterminal
-        S = nts[self.synth_fun["termType"]]
+        self.canonical = self._canonical_leaf()
+
+    def _canonical_leaf(self):
+        """
+        Returns the leaf production lines no later line refers to are pinned
+        to, or None. Its value must satisfy v >= 0 on every example, and
+        symmetry breaking rules out unreachable nonterminals on every line,
+        so it is a non-negative constant or an input that is non-negative
+        on all examples, of a reachable nonterminal. Constants come first.
+        """
+        problem = self.problem
+        constants = []
+        inputs = []
+        for prod in range(self.P):
+            template = self.templates[prod]
+            if problem.children[prod] or template is None or problem.prod_nt[prod] not in self.reachable_nts:
+                continue
+            _, operator, operand = template
+            if operator == "const" and operand >= 0:
+                constants.append(prod)
+            elif operator == "var" and (problem.inputs[operand] >= 0).all():
+                inputs.append(prod)
+        return (constants or inputs or [None])[0]
+
+    def _line_constraints(self, l):
+        """
+        Returns the constraints of a single line. None of them depend on
+        the program size, so they stay valid when more lines are added.
+        """
+        enc = self.encoding
+        problem = self.problem
 
         # List which holds constraints
         constraints = []
 
-        # Uninterpreted function constraints
-        
-        # Constraints on n_l
-        for l in range(L):
-            constraints.append(And(n_l(l) >= 0, n_l(l) < N))
-
-        # Constraints on p_l
-        for l in range(L):
-            constraints.append(And(p_l(l) >= 0, p_l(l) < P))  # Replace N with the number of productions
-
-        # Constraints on c
-        for l in range(L):
-            for k in range(K):
-                constraints.append(And(c(l, k) >= 0, c(l, k) < L))
+        # Range constraints on n_l, p_l and c
+        constraints.extend(enc.domain(l))
 
-        # Constraints on v_e_l
-        for e in range(len(examples)):
-            for l in range(L):
-                constraints.append(v_e_l(e,l) >= 0)  # Depends on value domain
-        
-        
         # Structural Constraints
-        
-        # Encoding: n_l(L-1) = S; last line is starting nonterminal
-        constraints.append(n_l(L - 1) == S)
 
         # Encoding: Assigns each child to appropriate nonterminal and lower line than parent
-        for i in range(L):
-            for production, child in children.items():
-                child_constraints = []
-                for child_idx, ch in enumerate(child):
-                    child_constraints.append(n_l(c(i,child_idx)) == nts[ch])
-                    child_constraints.append(c(i,child_idx) < i)
-                if len(child_constraints) != 0:
-                    constraints.append(
-                        Implies(p_l(i) == production_mappings[production],And(*child_constraints))
-                    )
-
-            # Encoding: Ensures consistency between nonterminal and production for each line
-            for nt in range(len(nt_prods)):
+        for production, child in enumerate(problem.children):
+            child_constraints = []
+            for child_idx, ch in enumerate(child):
+                child_constraints.append(enc.child(l, child_idx, enc.n) == enc.nt(ch))
+                child_constraints.append(enc.lt(enc.c(l,child_idx), l))
+            if len(child_constraints) != 0:
                 constraints.append(
-                    Implies(n_l(i) == nt, Or([p_l(i) == p for _, p in nt_prods[nt].items()]))
+                    Implies(enc.p(l) == enc.prod(production),And(*child_constraints))
                 )
 
+        # Encoding: Ensures consistency between nonterminal and production for each line
+        for nt, prods in enumerate(problem.nt_prods):
+            constraints.append(
+                Implies(enc.n(l) == enc.nt(nt), Or([enc.p(l) == enc.prod(p) for p in prods]))
+            )
+
+        # Encoding: productions without compiled semantics cannot be evaluated,
+        # so no line may use them
+        for production, template in enumerate(self.templates):
+            if template is None:
+                constraints.append(enc.p(l) != enc.prod(production))
+
+        if self.symmetry_breaking:
+            constraints.extend(self._symmetry_constraints(l))
+
+        for e in self.active_examples:
+            constraints.extend(self._example_constraints(e, l))
+
+        return constraints
+
+    def _symmetry_constraints(self, l):
+        """
+        Returns the constraints that rule out models equivalent to others
+        and productions that cannot occur on line l.
+        """
+        enc = self.encoding
+        children = self.problem.children
+        constraints = []
+
+        # Encoding: prunes productions whose children cannot fit below line l
+        # and nonterminals the start symbol never derives
+        for production in range(self.P):
+            if self.min_line[production] > l:
+                constraints.append(enc.p(l) != enc.prod(production))
+        for nt in range(self.N):
+            if nt not in self.reachable_nts:
+                constraints.append(enc.n(l) != enc.nt(nt))
+
+        # Encoding: child pointers beyond the arity of the production point to line 0
+        for k in range(self.K):
+            short = [enc.p(l) == enc.prod(production) for production in range(self.P)
+                     if len(children[production]) <= k]
+            if short:
+                constraints.append(Implies(Or(short), enc.c(l, k) == enc.line(0)))
+
+        # Encoding: operands of commutative operators are ordered by line
+        for production, template in enumerate(self.templates):
+            if template is None:
+                continue
+            _, operator, operands = template
+            if operator in COMMUTATIVE and len(operands) == 2:
+                i, j = operands
+                if children[production][i] == children[production][j]:
+                    constraints.append(Implies(
+                        enc.p(l) == enc.prod(production),
+                        enc.le(enc.c(l, i), enc.c(l, j))))
+
+        return constraints
+
+    def _referenced(self, l, L):
+        """
+        Returns a constraint stating that some line in (l, L) uses line l as a child.
+        """
+        enc = self.encoding
+        children = self.problem.children
+        references = []
+        for j in range(l + 1, L):
+            for k in range(self.K):
+                has_child = [enc.p(j) == enc.prod(production) for production in range(self.P)
+                             if len(children[production]) > k]
+                references.append(And(enc.c(j, k) == enc.line(l), Or(has_child)))
+        return Or(references)
+
+    def _unused_line_constraints(self, L):
+        """
+        Returns the symmetry breaking constraints on lines unused in a
+        program of size L. Iterative deepening finds the smallest size
+        first, so there every line below the root must be used; a fixed
+        size, which optimize always searches, keeps smaller programs and
+        puts unused lines in a canonical state.
+        """
+        enc = self.encoding
+        constraints = []
+        for l in range(L - 1):
+            if self.incremental and not self.optimize:
+                constraints.append(self._referenced(l, L))
+            elif self.canonical is not None:
+                constraints.append(Implies(
+                    Not(self._referenced(l, L)),
+                    enc.p(l) == enc.prod(self.canonical)))
+        return constraints
+
+    def _example_constraints(self, e, l):
+        """
+        Returns the behavioral constraints of example e on line l. The lazy
+        encoding only bounds the value here, see _refinements.
+        """
+        constraints = []
+
+        # Constraints on v_e_l
+        constraints.append(self.encoding.v(e,l) >= 0)  # Depends on value domain
+
+        if self.lazy:
+            return constraints
+
         # Behavioral Constraints
+        for production in range(self.P):
+            constraints.append(
+                Implies(self.encoding.p(l) == self.encoding.prod(production),self._op(production,e,l))
+            )
+
+        return constraints
+
+    def _expected_output(self, e):
+        return int(self.problem.outputs[e])
+
+    def _root(self, L):
+        """
+        Returns the literal guarding the constraints that make line L-1 the
+        root of a program of size L, asserting them on first use.
+        """
+        if L not in self.roots:
+            root = Bool("root_%d" % L)
+
+            # Encoding: n_l(L-1) = S; last line is starting nonterminal
+            constraints = [self.encoding.n(L - 1) == self.encoding.nt(self.S)]
+
+            # Encoding: root line produces the expected output on every example
+            for e in self.active_examples:
+                constraints.append(self.encoding.v(e,L - 1) == self._expected_output(e))
+
+            if self.symmetry_breaking:
+                constraints.extend(self._unused_line_constraints(L))
+
+            self.solver.add(Implies(root, And(constraints)))
+            self.profiler.count("constraints", len(constraints))
+            self.roots[L] = root
+        return self.roots[L]
 
-        # Function that enacts operations on children
-        def op(production, children_values, vars, example, line):
-            for prod, rule in chcs.items():
-                nonterm = 0
-                for i in range(len(nt_prods)):
-                    for p in nt_prods[i]:
-                        if prod == p:
-                            nonterm = i
-                for n, i in nts.items():
-                    if i == nonterm:
-                        nonterm = n
-                rule_name = nonterm + ".Sem"
-                inputs = symbols[rule_name]["inputs"]
-                output = symbols[rule_name]["outputs"][0]
-
-                if production == prod:
-                    if rule[0] == '=':
-                        if rule[1][0] == output and rule[1][1] in inputs:
-                            return v_e_l(example, line) == vars[rule[1][1]]
-                        elif rule[1][0] == output and isinstance(rule[1][1],int):
-                            return v_e_l(example, line) == rule[1][1]
-                        elif rule[1][0] == output and rule[1][1] == 'false':
-                            return v_e_l(example, line) == 0
-                        elif rule[1][0] == output and rule[1][1] == 'true':
-                            return v_e_l(example, line) == 1
-                        elif rule[1][0] == output and isinstance(rule[1][1],tuple):
-                            embedded_rule = rule[1][1]
-                            if embedded_rule[0] == '+':
-                                return v_e_l(example, line) == v_e_l(example,c(children_values[0][0],children_values[0][1])) + v_e_l(example,c(children_values[1][0],children_values[1][1]))
-                            if embedded_rule[0] == '-':
-                                return v_e_l(example, line) == v_e_l(example,c(children_values[0][0],children_values[0][1])) - v_e_l(example,c(children_values[1][0],children_values[1][1]))
-                            if embedded_rule[0] == '*':
-                                return v_e_l(example, line) == v_e_l(example,c(children_values[0][0],children_values[0][1])) * v_e_l(example,c(children_values[1][0],children_values[1][1]))
-                            if embedded_rule[0] == '/':
-                                return v_e_l(example, line) == v_e_l(example,c(children_values[0][0],children_values[0][1])) / v_e_l(example,c(children_values[1][0],children_values[1][1]))
-                            if embedded_rule[0] == '<':
-                                return If(v_e_l(example,c(children_values[0][0],children_values[0][1])) < v_e_l(example,c(children_values[1][0],children_values[1][1])),v_e_l(example, line) == 1,v_e_l(example, line) == 0)
-                            if embedded_rule[0] == '>':
-                                return If(v_e_l(example,c(children_values[0][0],children_values[0][1])) > v_e_l(example,c(children_values[1][0],children_values[1][1])),v_e_l(example, line) == 1,v_e_l(example, line) == 0)
-                            if embedded_rule[0] == '==':
-                                return If(v_e_l(example,c(children_values[0][0],children_values[0][1])) == v_e_l(example,c(children_values[1][0],children_values[1][1])),v_e_l(example, line) == 1,v_e_l(example, line) == 0)
-                            if embedded_rule[0] == 'not':
-                                return If(Not(v_e_l(example,c(children_values[0][0],children_values[0][1])) == 1), v_e_l(example, line) == 1, v_e_l(example, line) == 0)
-                            if embedded_rule[0] == 'and':
-                                If(And(v_e_l(example,c(children_values[0][0],children_values[0][1])) == 1,v_e_l(example,c(children_values[1][0],children_values[1][1])) == 1),v_e_l(example, line) == 1,v_e_l(example, line) == 0)
-                    elif rule[0] == 'ite':
-                        return If(v_e_l(example,c(children_values[0][0],children_values[0][1])) == 1, v_e_l(example, line) == v_e_l(example,c(children_values[1][0],children_values[1][1])), v_e_l(example, line) == v_e_l(example,c(children_values[2][0],children_values[2][1]))) 
+    def _activate_example(self, e):
+        """
+        Asserts the constraints of example e on every encoded line and size.
+        """
+        self._check_budget()
+        self.active_examples.append(e)
+        for l in range(self.encoded_lines):
+            for x in self._example_constraints(e, l):
+                self.solver.add(x)
+                self.profiler.count("constraints")
+        for L, root in self.roots.items():
+            self.solver.add(Implies(root, self.encoding.v(e,L - 1) == self._expected_output(e)))
+            self.profiler.count("constraints")
+        self.profiler.count("examples_activated")
+
+    def _activate_all_examples(self):
+        with self.profiler.phase("encode", profile=True):
+            for e in range(self.problem.num_examples):
+                if e not in self.active_examples:
+                    self._activate_example(e)
+
+    def _check_size(self, L):
+        """
+        Checks whether a program of size L satisfies the active examples.
+        """
+        with self.profiler.phase("encode", profile=True):
+            self._encode_lines(L)
+            root = self._root(L)
+
+        while True:
+            # The next check gets the time left until the deadline
+            left = self._check_budget()
+            if left is not None:
+                self.solver.set("timeout", max(int(left * 1000), 1))
+            with self.profiler.phase("check"):
+                start = time.perf_counter()
+                try:
+                    result = self.solver.check(root)
+                except Z3Exception as e:
+                    # Exceeding max_memory raises instead of returning unknown
+                    raise Interrupted(unknown, self._unknown_reason(
+                        e.value.decode() if isinstance(e.value, bytes) else str(e.value)))
+            self.profiler.record_check(self.solver, L, result, time.perf_counter() - start)
+            self.profiler.count("checks")
+            if result == unknown:
+                raise Interrupted(result, self._unknown_reason(self.solver.reason_unknown()))
+            if result != sat or not self.lazy:
+                return result == sat
+
+            with self.profiler.phase("encode", profile=True):
+                refinements = self._refinements(L)
+            if not refinements:
+                return True
+            for x in refinements:
+                self.solver.add(x)
+            self.profiler.count("constraints", len(refinements))
+            self.profiler.count("refinements")
+
+    def _check_budget(self):
+        """
+        Stops the solve if it was canceled or the deadline has passed.
+        Returns the seconds left, if there is a deadline.
+        """
+        if self.cancelled:
+            raise Interrupted(unknown, "canceled")
+        if self.deadline is None:
+            return None
+        left = self.deadline - time.perf_counter()
+        if left <= 0:
+            raise Interrupted(unknown, "timeout")
+        return left
+
+    @contextmanager
+    def _memory_budget(self):
+        """
+        Sets Z3's process-wide memory limit to max_memory for an Optimize
+        solve and restores the previous limit afterwards, so other solvers
+        of the process are not bounded by it.
+        """
+        if self.max_memory is None or not self.optimize:
+            yield
+            return
+        previous = get_param("memory_max_size")
+        set_param("memory_max_size", self.max_memory)
+        try:
+            yield
+        finally:
+            set_param("memory_max_size", previous)
+
+    def _unknown_reason(self, reason):
+        """
+        Returns why a check ended without sat or unsat. Z3 reports both its
+        own timeout and an interrupt as "canceled", so cancel() and the
+        deadline are told apart here.
+        """
+        if self.cancelled:
+            return "canceled"
+        if self.deadline is not None and (reason in ("canceled", "timeout") or time.perf_counter() >= self.deadline):
+            return "timeout"
+        return reason
+
+    def cancel(self):
+        """
+        Stops the running solve; safe to call from another thread. The
+        current check is interrupted and solve() reports it as unknown. A
+        cancel() issued before solve() starts stops that solve at once.
+        """
+        self.cancelled = True
+        # Optimize can only be interrupted through its whole Z3 context
+        if isinstance(self.solver, Optimize):
+            self.solver.ctx.interrupt()
+        else:
+            self.solver.interrupt()
+
+    def _refinements(self, L):
+        """
+        Returns the behavioral constraints the current model relies on but
+        that are not asserted yet: those of every active example for the
+        productions on the lines reachable from the root. An empty list
+        means the model is a program consistent with the active examples.
+        """
+        model = self.solver.model()
+        enc = self.encoding
+        constraints = []
+        for line, (production, _) in self.program_lines(model, L - 1).items():
+            for e in self.active_examples:
+                if (e, line, production) not in self.refined:
+                    self.refined.add((e, line, production))
+                    constraints.append(Implies(enc.p(line) == enc.prod(production), self._op(production, e, line)))
+        return constraints
+
+    def _encode_lines(self, L):
+        """
+        Asserts the line constraints of every line below L that is not yet encoded.
+        """
+        for l in range(self.encoded_lines, L):
+            self._check_budget()
+            for x in self._line_constraints(l):
+                self.solver.add(x)
+                self.profiler.count("constraints")
+            self.profiler.count("lines")
+            self.encoded_lines = l + 1
+
+    def _op(self, production, example, line):
+        """
+        Function that enacts operations on children
+        """
+        self.profiler.count("op")
+        template = self.templates[production]
+        if template is None:
             return True
 
-        for i in range(len(examples)):
-            output_var = symbols[examples[i][0]]["outputs"][0]
-            output = ex_vars[i][output_var]
-            constraints.append(v_e_l(i,L - 1) == output)
-
-            for j in range(L):
-                for production, child in children.items():
-                    children_values = []
-                    for child_idx, ch in enumerate(child):
-                        children_values.append((j,child_idx))
-
-                    constraints.append(
-                        Implies(p_l(j) == production_mappings[production],op(production, children_values,ex_vars[i],i,j))
-                    )
-
-        for x in constraints:
-            self.solver.add(x)
-        
-        result = self.solver.check()
-
-        def build_program(model, l):
-            index = model.eval(p_l(l))
-            prod = next((k for k, v in production_mappings.items() if v == index), None)
-            if (len(children[prod]) == 0):
-                return " " + str(prod[1:]) + " "
+        _, operator, operands = template
+        enc = self.encoding
+        value = enc.v(example, line)
+        if operator == "var":
+            return value == int(self.problem.inputs[operands][example])
+        if operator == "const":
+            return value == operands
+        args = [enc.child(line, k, lambda j: enc.v(example, j)) for k in operands]
+        return OPERATORS[operator](value, *args)
+
+    def program_lines(self, model, l):
+        """
+        Returns the lines reachable from line l in the model as a dict
+        mapping each line to its production index and the lines of its children.
+        """
+        lines = {}
+        pending = [l]
+        while pending:
+            line = pending.pop()
+            if line in lines:
+                continue
+            prod = self.encoding.index(model, self.encoding.p(line))
+            child_lines = [self.encoding.index(model, self.encoding.c(line, k)) for k in range(len(self.problem.children[prod]))]
+            lines[line] = (prod, child_lines)
+            pending.extend(child_lines)
+        return lines
+
+    def build_program(self, model, l):
+        index = self.encoding.index(model, self.encoding.p(l))
+        prod = self.problem.productions[index]
+        if (len(self.problem.children[index]) == 0):
+            return " " + str(prod[1:]) + " "
+        else:
+            program = str(prod[1:]) + " ( "
+            for i in range(len(self.problem.children[index])):
+                child_index = self.encoding.index(model, self.encoding.c(l,i))
+                program += self.build_program(model, child_index)
+            program += " ) "
+            return program
+
+    def _objective(self, L):
+        """
+        Returns the cost of the program rooted at line L-1: the number of
+        lines reachable from the root, or the sum of their production costs.
+        Whether a line is used is defined by one Boolean per line.
+        """
+        enc = self.encoding
+        children = self.problem.children
+        used = [Bool("used_%d" % l) for l in range(L)]
+        self.solver.add(used[L - 1])
+        for l in range(L - 1):
+            references = []
+            for j in range(l + 1, L):
+                for k in range(self.K):
+                    has_child = [enc.p(j) == enc.prod(production) for production in range(self.P)
+                                 if len(children[production]) > k]
+                    if has_child:
+                        references.append(And(used[j], enc.c(j, k) == enc.line(l), Or(has_child)))
+            self.solver.add(used[l] == Or(references))
+
+        terms = []
+        for l in range(L):
+            if self.optimize == "cost":
+                weight = Sum([If(enc.p(l) == enc.prod(production), self.costs.get(name, 1), 0)
+                              for production, name in enumerate(self.problem.productions)])
             else:
-                program = str(prod[1:]) + " ( "
-                for i in range(len(children[prod])):
-                    child_index = model.eval(c(l,i))
-                    program += build_program(model, child_index)
-                program += " ) "
-                return program
+                weight = IntVal(1)
+            terms.append(If(used[l], weight, 0))
+        return Sum(terms)
+
+    def optimal_encoding(self):
+        """
+        Finds a cheapest program of at most max_size lines with Z3's
+        Optimize, minimizing the lines used or their production costs. In
+        CEGIS mode the optimum on the working set of examples is checked on
+        all of them; since adding examples can only raise the optimum, the
+        first candidate passing every example is optimal. The search always
+        runs at size max_size, so incremental has no effect here.
+        """
+        L = self.max_size
+        with self.profiler.phase("encode", profile=True):
+            self._encode_lines(L)
+            if L not in self.objectives:
+                self.solver.minimize(self._objective(L))
+                self.objectives.add(L)
+
+        if not self.cegis:
+            self._activate_all_examples()
+        elif self.problem.num_examples and not self.active_examples:
+            with self.profiler.phase("encode", profile=True):
+                self._activate_example(self.initial_example)
+
+        while self._check_size(L):
+            model = self.solver.model()
+            lines = self.program_lines(model, L-1)
+            if self.cegis and self._refute(lines, L):
+                continue
+
+            self.lines = lines
+            self.size = len(lines)
+            return self.build_program(model, L-1)
+
+        return None
+
+    def linear_encoding(self):
+        """
+        Encodes the problem into a linear format using Z3.
+        """
 
-        if result == "unsat":
-            print("No Solution")
+        # Max size of program
+        L = self.max_size
+
+        self._activate_all_examples()
+
+        if not self._check_size(L):
+            return None
         else:
-            print("Solution found:")
             model = self.solver.model()
             #for var in model:
             #    print(f"{var}: {model[var]}")
-            print(build_program(model, L-1))
+            program = self.build_program(model, L-1)
+            self.lines = self.program_lines(model, L-1)
+            self.size = len(self.lines)
+            return program
 
+    def iterative_deepening(self):
+        """
+        Searches program sizes L = 1..max_size on a single solver. Line
+        constraints are asserted once and kept across sizes; only the root
+        constraints of each size are guarded by an assumption literal, so a
+        larger size adds the new line and never rebuilds the encoding.
+        """
+        self._activate_all_examples()
+
+        for L in range(1, self.max_size + 1):
+            if self._check_size(L):
+                model = self.solver.model()
+                program = self.build_program(model, L-1)
+                self.lines = self.program_lines(model, L-1)
+                self.size = len(self.lines)
+                return program
 
-    def solve(self):
+        return None
+
+    def _refute(self, lines, L):
+        """
+        Runs a candidate of size L on every example. Returns False if it
+        passes all of them. Otherwise its first failing example that is not
+        active yet joins the working set; a candidate that only fails active
+        examples, on which the encoding and the interpreter disagree, is
+        blocked instead. Returns True in both cases.
+        """
+        with self.profiler.phase("evaluate"):
+            counterexample = self.interpreter.counterexample(lines, L-1, skip=self.active_examples)
+            valid = counterexample is None and self.interpreter.validate(lines, L-1)
+        if counterexample is not None:
+            with self.profiler.phase("encode", profile=True):
+                self._activate_example(counterexample)
+        elif not valid:
+            self._block(lines, L)
+        return not valid
+
+    def counterexample_guided(self):
+        """
+        Solves against a growing working set of examples. Each candidate is
+        evaluated concretely on the whole specification and only the first
+        failing example is added to the solver, so the query stays small
+        while the returned program still satisfies every example.
+        """
+        if not self.problem.num_examples:
+            return self.iterative_deepening() if self.incremental else self.linear_encoding()
+
+        if not self.active_examples:
+            with self.profiler.phase("encode", profile=True):
+                self._activate_example(self.initial_example)
+
+        # A size that is unsat on a subset of the examples stays unsat once
+        # more examples are added, so the search never revisits it
+        sizes = range(1, self.max_size + 1) if self.incremental else [self.max_size]
+        for L in sizes:
+            while self._check_size(L):
+                model = self.solver.model()
+                lines = self.program_lines(model, L-1)
+                if not self._refute(lines, L):
+                    self.lines = lines
+                    self.size = len(lines)
+                    return self.build_program(model, L-1)
+
+        return None
+
+    def program_cost(self, lines, costs):
+        """
+        Returns the cost of a program: the sum over its distinct lines of
+        the cost of their production, given by name in costs (default 1).
+        """
+        return sum(costs.get(self.problem.productions[prod], 1) for prod, _ in lines.values())
+
+    def _block(self, lines, L):
+        """
+        Rules out the given assignment of productions and children to the
+        lines of a program of size L.
+        """
+        enc = self.encoding
+        same = []
+        for line, (production, child_lines) in lines.items():
+            same.append(enc.p(line) == enc.prod(production))
+            for k, child in enumerate(child_lines):
+                same.append(enc.c(line, k) == enc.line(child))
+        self.solver.add(Implies(self._root(L), Not(And(same))))
+        self.profiler.count("constraints")
+
+    def solutions(self, k, order = "size", costs = None):
         """
-        Solves the problem and prints results.
+        Finds up to k distinct programs and returns a SynthesisResult whose
+        solutions lists them as dicts with the program, its size and its
+        cost (see program_cost). After each model the solver stays alive
+        and a blocking constraint over the used lines' p_l and c asks for
+        another program. With order "size" every size is searched from 1
+        up, so these are the k smallest programs; the found programs can
+        also be ordered by "cost". In CEGIS mode a candidate failing an
+        example adds that example instead of being counted.
+
+        The status is "sat" once k programs are found and "unsat" if fewer
+        exist. A search that runs out of budget or is canceled reports
+        "timeout" or "unknown" with the programs found so far.
         """
+        start = time.perf_counter()
+        costs = costs or self.costs
+        self.deadline = start + self.timeout if self.timeout is not None else None
+
+        found = {}
+        status, reason = "unsat", None
+        sizes = range(1, self.max_size + 1) if self.incremental or order == "size" else [self.max_size]
+        try:
+            with self._memory_budget():
+                if not self.cegis:
+                    self._activate_all_examples()
+                elif self.problem.num_examples and not self.active_examples:
+                    with self.profiler.phase("encode", profile=True):
+                        self._activate_example(self.initial_example)
+
+                for L in sizes:
+                    while len(found) < k and self._check_size(L):
+                        model = self.solver.model()
+                        lines = self.program_lines(model, L-1)
+                        if self.cegis and self._refute(lines, L):
+                            continue
+
+                        program = self.build_program(model, L-1)
+                        if program not in found:
+                            found[program] = {"program": program, "size": len(lines), "cost": self.program_cost(lines, costs)}
+                        self._block(lines, L)
+                    if len(found) >= k:
+                        status = "sat"
+                        break
+        except Interrupted as e:
+            interrupted = SynthesisResult.from_check(e.result, e.reason)
+            status, reason = interrupted.status, interrupted.reason
+        finally:
+            # A cancel() applies to a single search
+            self.cancelled = False
+
+        programs = list(found.values())
+        if order == "cost":
+            programs.sort(key=lambda solution: (solution["cost"], solution["size"]))
+        else:
+            programs.sort(key=lambda solution: solution["size"])
+
+        first = programs[0] if programs else {}
+        return SynthesisResult(
+            status, first.get("program"), first.get("size"), first.get("cost"), reason,
+            time=time.perf_counter() - start, stats=self._stats(), solutions=programs)
+
+    def load_examples(self, problem):
+        """
+        Makes the solver solve problem, which must share this solver's
+        grammar, keeping the line constraints already asserted. On the first
+        call the line constraints of every size up to max_size are asserted
+        at the base level; everything that depends on the examples (example
+        and root constraints) is asserted in a solver scope that the next
+        call pops, so a warm solver only re-encodes the examples. The
+        profiler is reset on reuse, so its report covers one problem only.
+        """
+        if problem.grammar_fingerprint() != self.problem.grammar_fingerprint():
+            raise ValueError("load_examples() needs a problem with the same grammar")
+
+        if self.scoped:
+            self.profiler.reset()
+            self.solver.pop()
+        elif self.active_examples:
+            raise ValueError("load_examples() must be called before the first solve")
+        else:
+            with self.profiler.phase("encode", profile=True):
+                self._encode_lines(self.max_size)
+
+        self.problem = problem
+        self.interpreter = Interpreter(problem)
+        self.canonical = self._canonical_leaf()
+        self.active_examples = []
+        self.roots = {}
+        self.objectives = set()
+        self.refined = set()
+        self.initial_example = 0
+        self.size = None
+        self.lines = None
+        self.solver.push()
+        self.scoped = True
+
+    def _evaluable(self, lines):
+        """
+        Returns whether the interpreter can run a program, i.e. whether all
+        of its productions have compiled semantics.
+        """
+        return all(self.templates[prod] is not None for prod, _ in lines.values())
+
+    def cached_solution(self):
+        """
+        Tries the cached programs of this grammar whose examples are the
+        same as or a subset of ours, evaluating each concretely on every
+        example. Returns the first one that passes, or None; a failing
+        candidate's first counterexample starts the CEGIS working set.
+        """
+        for lines, program in self.solution_cache.candidates(self.problem):
+            if len(lines) > self.max_size or not self._evaluable(lines):
+                continue
+            with self.profiler.phase("evaluate"):
+                counterexample = self.interpreter.counterexample(lines, max(lines))
+            if counterexample is None:
+                self.lines = lines
+                self.size = len(lines)
+                self.profiler.count("cache_hits")
+                return program
+            if self.initial_example == 0:
+                self.initial_example = counterexample
+        return None
+
+    def _stats(self):
+        checks = self.profiler.checks
+        return {
+            "times": dict(self.profiler.times),
+            "counts": dict(self.profiler.counts),
+            "active_examples": len(self.active_examples),
+            "last_check": checks[-1] if checks else None,
+        }
+
+    def _search(self):
+        # A cached program is correct but not necessarily the cheapest or
+        # the smallest, as optimize and incremental promise
+        if self.solution_cache is not None and not self.optimize and not self.incremental:
+            program = self.cached_solution()
+            if program is not None:
+                return program
 
-        print("Encoding problem...")
-        self.linear_encoding()
+        if self.optimize:
+            program = self.optimal_encoding()
+        elif self.cegis:
+            program = self.counterexample_guided()
+        elif self.incremental:
+            program = self.iterative_deepening()
+        else:
+            program = self.linear_encoding()
 
+        if program is not None and self.solution_cache is not None and self._evaluable(self.lines):
+            self.solution_cache.put(self.problem, self.lines, program)
+        return program
+
+    def solve(self):
+        """
+        Solves the problem within the time and memory budgets and returns a
+        SynthesisResult. A solve that runs out of budget, is canceled or
+        that Z3 gives up on returns its status with the stats so far.
+        """
+        start = time.perf_counter()
+        self.deadline = start + self.timeout if self.timeout is not None else None
+        try:
+            with self._memory_budget():
+                program = self._search()
+        except Interrupted as e:
+            return SynthesisResult.from_check(e.result, e.reason, time=time.perf_counter() - start, stats=self._stats())
+        finally:
+            # A cancel() applies to a single solve
+            self.cancelled = False
+
+        if program is None:
+            return SynthesisResult("unsat", time=time.perf_counter() - start, stats=self._stats())
+        return SynthesisResult(
+            "sat", program, self.size,
+            cost=self.program_cost(self.lines, self.costs) if self.optimize else None,
+            time=time.perf_counter() - start,
+            stats=self._stats())